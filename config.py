@@ -16,10 +16,16 @@ class Config:
     
     # --- Database ---
     DATABASE_URL: str = os.environ.get("DATABASE_URL", "")
+    DB_POOL_SIZE: int = int(os.environ.get("DB_POOL_SIZE", "8"))  # Threads for blocking DB calls
+    DB_MIN_CONNECTIONS: int = int(os.environ.get("DB_MIN_CONNECTIONS", "5"))  # Kept open so the pool stays warm
+    DB_MAX_CONNECTIONS: int = int(os.environ.get("DB_MAX_CONNECTIONS", "10"))
+    DB_INSTANCES: int = int(os.environ.get("DB_INSTANCES", "1"))  # Bot processes sharing one Postgres server
+    DB_PREPARE_STATEMENTS: bool = os.environ.get("DB_PREPARE_STATEMENTS", "1") == "1"  # Turn off behind PgBouncer
     
     # --- Chrome/Selenium ---
     CHROME_BINARY_PATH: str = os.environ.get("GOOGLE_CHROME_BIN", "")
     CHROMEDRIVER_PATH: str = os.environ.get("CHROMEDRIVER_PATH", "")
+    SCRAPER_POOL_SIZE: int = int(os.environ.get("SCRAPER_POOL_SIZE", "2"))  # Parallel Chrome sessions
     
     # --- Timezone ---
     BOT_TIMEZONE: str = os.environ.get("BOT_TIMEZONE", "Asia/Kolkata")
@@ -28,6 +34,7 @@ class Config:
     CHECK_INTERVAL_SECONDS: int = int(os.environ.get("CHECK_INTERVAL_SECONDS", "30"))  # 5 minutes
     EXPIRY_CHECK_INTERVAL_SECONDS: int = int(os.environ.get("EXPIRY_CHECK_INTERVAL_SECONDS", "86400"))
     RETRY_DELAY_SECONDS: int = int(os.environ.get("RETRY_DELAY_SECONDS", "5"))
+    PINCODE_DELAY_SECONDS: float = float(os.environ.get("PINCODE_DELAY_SECONDS", "0"))  # Pause between pincodes
     
     @classmethod
     def validate(cls) -> bool:
@@ -3,9 +3,12 @@ Database module for Amul Product Alert Bot.
 Handles all PostgreSQL database operations with connection pooling.
 """
 
-import asyncio
+import time
+import threading
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extras import execute_values
+from functools import wraps
 from contextlib import contextmanager
 from urllib.parse import urlparse
 from datetime import date, timedelta
@@ -15,22 +18,117 @@ from config import Config
 
 
 # --- Connection Pool ---
-_connection_pool: Optional[pool.SimpleConnectionPool] = None
+# ThreadedConnectionPool: DB calls come from several executor threads at once
+_connection_pool: Optional[pool.ThreadedConnectionPool] = None
 
+# Connections idle in the pool longer than this are closed on checkout
+# rather than handed out, since servers and proxies drop idle sessions
+CONNECTION_MAX_IDLE_SECONDS = 30 * 60
 
-def init_connection_pool(min_connections: int = 1, max_connections: int = 10) -> None:
-    """Initialize the database connection pool."""
+# A connection that completed a query this recently is assumed alive by the
+# health check, which then skips its SELECT 1
+HEALTH_CHECK_TRUST_SECONDS = 60
+
+# Share of the server's max_connections all bot instances together may hold
+SERVER_CONNECTION_SHARE = 0.25
+
+# How long a caller waits for a free pooled connection before giving up
+POOL_WAIT_TIMEOUT_SECONDS = 30
+
+
+class _PooledConnection(psycopg2.extensions.connection):
+    """Connection that tracks its PREPAREd statements and when it was last used."""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements: set = set()
+        self.last_used = time.monotonic()
+
+
+class _BlockingConnectionPool(pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool that waits for a free connection instead of raising when exhausted."""
+    
+    def __init__(self, minconn: int, maxconn: int, *args, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+    
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=POOL_WAIT_TIMEOUT_SECONDS):
+            raise pool.PoolError(
+                f"no connection available after {POOL_WAIT_TIMEOUT_SECONDS}s"
+            )
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+    
+    def discard(self, conn) -> None:
+        """Close a connection checked out before the pool was closed and free its slot."""
+        try:
+            conn.close()
+        finally:
+            self._slots.release()
+
+
+def _server_connection_budget(connect_kwargs: Dict[str, Any]) -> Optional[int]:
+    """This process's share of the server's max_connections, or None if it can't be read."""
+    try:
+        conn = psycopg2.connect(**connect_kwargs)
+        try:
+            cur = conn.cursor()
+            cur.execute("SHOW max_connections;")
+            server_max = int(cur.fetchone()[0])
+        finally:
+            conn.close()
+    except Exception:
+        return None
+    
+    return max(2, int(server_max * SERVER_CONNECTION_SHARE) // max(1, Config.DB_INSTANCES))
+
+
+def init_connection_pool(
+    min_connections: int = Config.DB_MIN_CONNECTIONS,
+    max_connections: int = Config.DB_MAX_CONNECTIONS
+) -> None:
+    """
+    Initialize the database connection pool.
+    
+    The pool opens min_connections up front, so the first queries after
+    startup don't pay for a connect/TLS handshake.
+    
+    Safe behind PgBouncer in transaction pooling mode as long as
+    DB_PREPARE_STATEMENTS is off: no other session state (SET, LISTEN,
+    advisory locks) is relied on.
+    """
     global _connection_pool
     
     result = urlparse(Config.DATABASE_URL)
-    _connection_pool = pool.SimpleConnectionPool(
-        min_connections,
-        max_connections,
+    connect_kwargs = dict(
         dbname=result.path[1:],
         user=result.username,
         password=result.password,
         host=result.hostname,
-        port=result.port
+        port=result.port,
+    )
+    
+    # Stay within our share of the server so several instances can't exhaust it
+    budget = _server_connection_budget(connect_kwargs)
+    if budget is not None:
+        max_connections = min(max_connections, budget)
+        min_connections = min(min_connections, max_connections)
+    
+    _connection_pool = _BlockingConnectionPool(
+        min_connections,
+        max_connections,
+        connection_factory=_PooledConnection,
+        **connect_kwargs
     )
 
 
@@ -53,11 +151,25 @@ def validate_connection_pool() -> bool:
     global _connection_pool
     
     try:
-        # Try to get and test a connection
-        with get_db_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT 1;")
-            cur.close()
+        if _connection_pool is None:
+            init_connection_pool()
+        
+        # Checked out directly so an unpinged check doesn't count as "used"
+        conn = _connection_pool.getconn()
+        try:
+            # Cheap local checks first - no network round trip
+            if conn.closed or conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                raise psycopg2.InterfaceError("connection is closed or broken")
+            
+            # Only ping a connection that hasn't proven itself recently
+            if not isinstance(conn, _PooledConnection) or time.monotonic() - conn.last_used > HEALTH_CHECK_TRUST_SECONDS:
+                cur = conn.cursor()
+                cur.execute("SELECT 1;")
+                cur.close()
+                if isinstance(conn, _PooledConnection):
+                    conn.last_used = time.monotonic()
+        finally:
+            _connection_pool.putconn(conn)
         
         # Pool is healthy
         return True
@@ -79,29 +191,6 @@ def validate_connection_pool() -> bool:
             return False
 
 
-# --- Async Helpers ---
-async def run_async_db_operation(func: Callable, *args, **kwargs):
-    """
-    Run a blocking database operation in a thread pool to avoid blocking event loop.
-    
-    Usage:
-        result = await run_async_db_operation(get_user_preferences, user_id)
-    """
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, func, *args)
-
-
-async def run_async_db_operation_kwargs(func: Callable, **kwargs):
-    """
-    Run a blocking database operation with keyword arguments in a thread pool.
-    
-    Usage:
-        result = await run_async_db_operation_kwargs(some_func, arg1=val1, arg2=val2)
-    """
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, lambda: func(**kwargs))
-
-
 @contextmanager
 def get_db_connection():
     """
@@ -114,16 +203,33 @@ def get_db_connection():
             cur.execute(...)
             conn.commit()
     """
-    global _connection_pool
-    
-    if _connection_pool is None:
+    # Bind the pool once: one global lookup per call, and the connection goes
+    # back to the pool it came from even if the health check swaps pools meanwhile
+    db_pool = _connection_pool
+    if db_pool is None:
         init_connection_pool()
+        db_pool = _connection_pool
+    
+    conn = db_pool.getconn()
+    while (
+        isinstance(conn, _PooledConnection)
+        and time.monotonic() - conn.last_used > CONNECTION_MAX_IDLE_SECONDS
+    ):
+        # Recycle a connection that sat idle too long instead of risking a dead socket
+        db_pool.putconn(conn, close=True)
+        conn = db_pool.getconn()
     
-    conn = _connection_pool.getconn()
     try:
         yield conn
     finally:
-        _connection_pool.putconn(conn)
+        if isinstance(conn, _PooledConnection):
+            conn.last_used = time.monotonic()
+        if not db_pool.closed:
+            db_pool.putconn(conn)
+        else:
+            # Wakes any thread still waiting on this pool; its getconn then
+            # fails fast because the pool is closed
+            db_pool.discard(conn)
 
 
 @contextmanager
@@ -146,6 +252,164 @@ def get_db_cursor(commit: bool = False):
             cur.close()
 
 
+@contextmanager
+def get_db_stream_cursor(name: str, itersize: int = 2000):
+    """
+    Context manager for a named (server-side) cursor.
+    Rows are fetched from the server `itersize` at a time while iterating.
+    
+    Usage:
+        with get_db_stream_cursor("active_users") as cur:
+            cur.execute(...)
+            for row in cur: ...
+    """
+    with get_db_connection() as conn:
+        cur = conn.cursor(name=name)
+        cur.itersize = itersize
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+
+# --- Prepared Statements ---
+# Hot single-row statements, PREPAREd lazily once per connection so repeat
+# calls skip parse/plan. Written with %s placeholders for the plain fallback.
+_PREPARED_STATEMENTS: Dict[str, Tuple[str, str]] = {
+    "get_product_status": (
+        "(text, text)",
+        "SELECT status FROM product_status_cache WHERE product_url = %s AND pincode = %s",
+    ),
+    "set_product_status": (
+        "(text, text, text)",
+        """INSERT INTO product_status_cache (product_url, pincode, status)
+           VALUES (%s, %s, %s)
+           ON CONFLICT (product_url, pincode) 
+           DO UPDATE SET status = EXCLUDED.status, last_updated = CURRENT_TIMESTAMP""",
+    ),
+    "get_user": (
+        "(bigint)",
+        """SELECT chat_id, username, pincode, subscription_status, start_date, end_date 
+           FROM users WHERE chat_id = %s""",
+    ),
+    "upsert_user": (
+        "(bigint, varchar)",
+        """INSERT INTO users (chat_id, username, subscription_status) 
+           VALUES (%s, %s, 'none') 
+           ON CONFLICT (chat_id) DO UPDATE SET username = EXCLUDED.username
+           RETURNING pincode, subscription_status, end_date""",
+    ),
+    "get_setting": (
+        "(varchar)",
+        "SELECT value FROM settings WHERE key = %s",
+    ),
+}
+
+
+def _execute_prepared(cur, name: str, params: Tuple) -> None:
+    """Execute a named statement, PREPAREing it on this connection first if needed."""
+    arg_types, sql = _PREPARED_STATEMENTS[name]
+    conn = cur.connection
+    
+    if not Config.DB_PREPARE_STATEMENTS or not isinstance(conn, _PooledConnection):
+        cur.execute(sql, params)
+        return
+    
+    if name not in conn.prepared_statements:
+        server_sql = "".join(
+            f"${i}{part}" if i else part for i, part in enumerate(sql.split("%s"))
+        )
+        cur.execute(f"PREPARE {name} {arg_types} AS {server_sql};")
+        conn.prepared_statements.add(name)
+    
+    cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))});", params)
+
+
+# --- Read Cache ---
+# Rarely-changing query results are kept for a short TTL. Writers that change
+# the underlying rows drop the entry so the next read hits the database.
+# Every writer of users.pincode / subscription_status invalidates pincode_data,
+# so its TTL only bounds staleness from edits made outside this process.
+# Invalidation also bumps a per-name generation, so a read that was already
+# running on another thread can't store its now-stale result afterwards.
+PINCODE_DATA_TTL_SECONDS = 10 * 60
+ALL_PRODUCTS_TTL_SECONDS = 300
+USER_READ_TTL_SECONDS = 30
+PRODUCTS_FOR_PINCODE_TTL_SECONDS = 30
+BLOCKED_IDS_TTL_SECONDS = 60
+SETTINGS_TTL_SECONDS = 60
+READ_CACHE_MAX_ENTRIES = 1024
+_read_cache: Dict[Tuple, Tuple[float, Any]] = {}
+_read_cache_generations: Dict[str, int] = {}
+_read_cache_lock = threading.Lock()
+
+
+_MISSING = object()
+
+
+def _read_cache_get(key: Tuple) -> Any:
+    """Return a fresh cached value for key, or _MISSING."""
+    with _read_cache_lock:
+        entry = _read_cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return _MISSING
+
+
+def _read_cache_generation(name: str) -> int:
+    """Current invalidation generation of a cached query name."""
+    with _read_cache_lock:
+        return _read_cache_generations.get(name, 0)
+
+
+def _read_cache_put(key: Tuple, value: Any, ttl: float, generation: Optional[int] = None) -> None:
+    """
+    Store a value, pruning expired entries (or everything) when full.
+    
+    A value read from the database passes the generation taken before the
+    read; it is dropped if the entry was invalidated since.
+    """
+    now = time.monotonic()
+    with _read_cache_lock:
+        if generation is not None and _read_cache_generations.get(key[0], 0) != generation:
+            return
+        if len(_read_cache) >= READ_CACHE_MAX_ENTRIES:
+            for stale in [k for k, (expires, _) in _read_cache.items() if expires <= now]:
+                del _read_cache[stale]
+            if len(_read_cache) >= READ_CACHE_MAX_ENTRIES:
+                _read_cache.clear()
+        _read_cache[key] = (now + ttl, value)
+
+
+def _ttl_cached(name: str, ttl: float) -> Callable:
+    """Cache a read function's result per positional arguments for ttl seconds."""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapped(*args):
+            key = (name, *args)
+            value = _read_cache_get(key)
+            if value is _MISSING:
+                generation = _read_cache_generation(name)
+                value = func(*args)
+                _read_cache_put(key, value, ttl, generation)
+            return value
+        return wrapped
+    return decorator
+
+
+def _invalidate_read_cache(name: str, *args) -> None:
+    """Drop a cached query result and fence off reads of it already in flight."""
+    with _read_cache_lock:
+        _read_cache.pop((name, *args), None)
+        _read_cache_generations[name] = _read_cache_generations.get(name, 0) + 1
+
+
+def _invalidate_user_reads(chat_id: int) -> None:
+    """Drop every cached per-user read for a chat_id."""
+    for name in ("alert_frequency", "quiet_hours", "user_paused"):
+        _invalidate_read_cache(name, chat_id)
+
+
 # --- Database Initialization ---
 def init_db() -> None:
     """Initialize database tables if they don't exist and validate connection."""
@@ -186,16 +450,11 @@ def init_db() -> None:
                 ("quiet_hours_end", "TIME")
             ]
                 
-            for col_name, col_type in columns_to_add:
-                cur.execute(f"""
-                    DO $$ 
-                    BEGIN 
-                        IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                                    WHERE table_name='users' AND column_name='{col_name}') THEN
-                            ALTER TABLE users ADD COLUMN {col_name} {col_type};
-                        END IF;
-                    END $$;
-                """)
+            # One ALTER TABLE (one lock) for every missing column
+            cur.execute("ALTER TABLE users " + ", ".join(
+                f"ADD COLUMN IF NOT EXISTS {col_name} {col_type}"
+                for col_name, col_type in columns_to_add
+            ) + ";")
         
         # 3. Create blocklist table
         with get_db_cursor(commit=True) as cur:
@@ -256,14 +515,24 @@ def init_db() -> None:
             """)
             
             # Migration: Add pincode column to pending_alerts if it doesn't exist
+            cur.execute("ALTER TABLE pending_alerts ADD COLUMN IF NOT EXISTS pincode VARCHAR(6);")
+            
+            # Partial indexes matching the hot scraper/scheduler predicates
             cur.execute("""
-                DO $$ 
-                BEGIN 
-                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                                WHERE table_name='pending_alerts' AND column_name='pincode') THEN
-                        ALTER TABLE pending_alerts ADD COLUMN pincode VARCHAR(6);
-                    END IF;
-                END $$;
+                CREATE INDEX IF NOT EXISTS idx_users_active_pincode 
+                    ON users (pincode, chat_id) WHERE subscription_status = 'active' AND pincode IS NOT NULL;
+                CREATE INDEX IF NOT EXISTS idx_users_active 
+                    ON users (chat_id) WHERE subscription_status = 'active';
+                CREATE INDEX IF NOT EXISTS idx_users_freq_active 
+                    ON users (alert_frequency) WHERE subscription_status = 'active';
+                CREATE INDEX IF NOT EXISTS idx_users_paused_until 
+                    ON users (pause_until) WHERE is_paused = TRUE;
+                CREATE INDEX IF NOT EXISTS idx_users_expire 
+                    ON users (end_date) WHERE subscription_status = 'active';
+                CREATE INDEX IF NOT EXISTS idx_pending_unsent 
+                    ON pending_alerts (chat_id, created_at) WHERE sent = FALSE;
+                CREATE INDEX IF NOT EXISTS idx_cache_pincode 
+                    ON product_status_cache (pincode);
             """)
             
             # Set default settings
@@ -280,42 +549,61 @@ def init_db() -> None:
 
 
 # --- Settings Operations ---
+@_ttl_cached("setting", SETTINGS_TTL_SECONDS)
 def get_setting(key: str) -> str:
     """Fetch a setting value from the database."""
     with get_db_cursor() as cur:
-        cur.execute("SELECT value FROM settings WHERE key = %s;", (key,))
+        _execute_prepared(cur, "get_setting", (key,))
         result = cur.fetchone()
         return result[0] if result else '0'
 
 
 def set_setting(key: str, value: str) -> None:
     """Update a setting value in the database."""
+    # Idempotent toggles (e.g. /autoapprove on twice) skip the write entirely
+    if _read_cache_get(("setting", key)) == value:
+        return
+    
     with get_db_cursor(commit=True) as cur:
         cur.execute("""
             INSERT INTO settings (key, value) 
             VALUES (%s, %s) 
-            ON CONFLICT (key) DO UPDATE SET value = %s;
-        """, (key, value, value))
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+            WHERE settings.value IS DISTINCT FROM EXCLUDED.value;
+        """, (key, value))
+    # Fence off reads already in flight, then write through so the next read
+    # doesn't go back to the database
+    _invalidate_read_cache("setting", key)
+    _read_cache_put(("setting", key), value, SETTINGS_TTL_SECONDS)
+
+
+def peek_setting(key: str) -> Optional[str]:
+    """Return a setting from the read cache if it is fresh, without touching the database."""
+    value = _read_cache_get(("setting", key))
+    return None if value is _MISSING else value
 
 
 # --- User Operations ---
 def upsert_user(chat_id: int, username: Optional[str]) -> None:
     """Insert or update a user in the database."""
+    register_user(chat_id, username)
+
+
+def register_user(chat_id: int, username: Optional[str]) -> Tuple[Optional[str], str, Optional[date]]:
+    """
+    Insert or update a user and return their (pincode, status, end_date).
+    
+    One round trip for what /start used to do with an upsert and two reads.
+    """
     with get_db_cursor(commit=True) as cur:
-        cur.execute("""
-            INSERT INTO users (chat_id, username, subscription_status) 
-            VALUES (%s, %s, 'none') 
-            ON CONFLICT (chat_id) DO UPDATE SET username = %s;
-        """, (chat_id, username, username))
+        _execute_prepared(cur, "upsert_user", (chat_id, username))
+        return cur.fetchone()
 
 
 def get_user(chat_id: int) -> Optional[Tuple]:
     """Get user data by chat_id."""
     with get_db_cursor() as cur:
-        cur.execute("""
-            SELECT chat_id, username, pincode, subscription_status, start_date, end_date 
-            FROM users WHERE chat_id = %s;
-        """, (chat_id,))
+        _execute_prepared(cur, "get_user", (chat_id,))
         return cur.fetchone()
 
 
@@ -331,6 +619,49 @@ def update_user_pincode(chat_id: int, pincode: str) -> None:
     """Update user's pincode."""
     with get_db_cursor(commit=True) as cur:
         cur.execute("UPDATE users SET pincode = %s WHERE chat_id = %s;", (pincode, chat_id))
+    _invalidate_read_cache("pincode_data")
+
+
+def change_user_pincode(
+    chat_id: int, 
+    pincode: str, 
+    trial_days: Optional[int] = None
+) -> Tuple[str, Optional[date]]:
+    """
+    Set a user's pincode and drop their queued alerts in one statement.
+    If trial_days is given and the user isn't active yet, also start a trial.
+    
+    Returns:
+        tuple: (status before the change, trial end date or None if no trial started)
+    """
+    start_date = date.today()
+    with get_db_cursor(commit=True) as cur:
+        cur.execute("""
+            WITH cleared AS (
+                DELETE FROM pending_alerts WHERE chat_id = %(chat_id)s
+            ), old AS (
+                SELECT subscription_status AS old_status,
+                       %(trial_days)s::int IS NOT NULL 
+                           AND subscription_status IS DISTINCT FROM 'active' AS start_trial
+                FROM users WHERE chat_id = %(chat_id)s
+                FOR UPDATE
+            )
+            UPDATE users u
+            SET pincode = %(pincode)s,
+                subscription_status = CASE WHEN old.start_trial THEN 'active' ELSE u.subscription_status END,
+                start_date = CASE WHEN old.start_trial THEN %(start_date)s ELSE u.start_date END,
+                end_date = CASE WHEN old.start_trial THEN %(start_date)s + %(trial_days)s::int ELSE u.end_date END
+            FROM old
+            WHERE u.chat_id = %(chat_id)s
+            RETURNING old.old_status, CASE WHEN old.start_trial THEN u.end_date END;
+        """, {"chat_id": chat_id, "pincode": pincode, "trial_days": trial_days, "start_date": start_date})
+        result = cur.fetchone()
+    
+    _invalidate_read_cache("pincode_data")
+    if not result:
+        return 'none', None
+    old_status, trial_end = result
+    return old_status or 'none', trial_end
 
 
 def activate_user_subscription(chat_id: int, days: int = 30) -> Tuple[date, date]:
@@ -344,27 +675,23 @@ def activate_user_subscription(chat_id: int, days: int = 30) -> Tuple[date, date
             SET subscription_status = 'active', start_date = %s, end_date = %s 
             WHERE chat_id = %s;
         """, (start_date, end_date, chat_id))
+    _invalidate_read_cache("pincode_data")
     
     return start_date, end_date
 
 
 def extend_user_subscription(chat_id: int, days: int) -> Optional[date]:
     """Extend an active user's subscription by specified days."""
+    # date + integer stays a DATE; GREATEST skips a NULL end_date
     with get_db_cursor(commit=True) as cur:
         cur.execute("""
-            SELECT end_date FROM users 
-            WHERE chat_id = %s AND subscription_status = 'active';
-        """, (chat_id,))
+            UPDATE users 
+            SET end_date = GREATEST(%s, end_date) + %s 
+            WHERE chat_id = %s AND subscription_status = 'active'
+            RETURNING end_date;
+        """, (date.today(), days, chat_id))
         result = cur.fetchone()
-        
-        if result:
-            current_end_date = result[0]
-            base_date = max(date.today(), current_end_date)
-            new_end_date = base_date + timedelta(days=days)
-            
-            cur.execute("UPDATE users SET end_date = %s WHERE chat_id = %s;", (new_end_date, chat_id))
-            return new_end_date
-        return None
+        return result[0] if result else None
 
 
 # --- Pause/Resume Functions ---
@@ -378,6 +705,7 @@ def pause_user_subscription(chat_id: int, days: int = 30) -> Optional[date]:
             SET is_paused = TRUE, pause_until = %s 
             WHERE chat_id = %s AND subscription_status = 'active';
         """, (resume_date, chat_id))
+    _invalidate_read_cache("user_paused", chat_id)
     
     return resume_date
 
@@ -390,7 +718,10 @@ def resume_user_subscription(chat_id: int) -> bool:
             SET is_paused = FALSE, pause_until = NULL 
             WHERE chat_id = %s;
         """, (chat_id,))
-        return cur.rowcount > 0
+        resumed = cur.rowcount > 0
+    
+    _invalidate_read_cache("user_paused", chat_id)
+    return resumed
 
 
 def get_paused_users() -> List[int]:
@@ -403,6 +734,7 @@ def get_paused_users() -> List[int]:
         return [row[0] for row in cur.fetchall()]
 
 
+@_ttl_cached("user_paused", USER_READ_TTL_SECONDS)
 def is_user_paused(chat_id: int) -> bool:
     """Check if user is currently paused."""
     with get_db_cursor() as cur:
@@ -423,6 +755,16 @@ def get_pause_until_date(chat_id: int) -> Optional[date]:
         return result[0] if result else None
 
 
+def get_user_pause_state(chat_id: int) -> Tuple[bool, Optional[date], Optional[str]]:
+    """Get whether a user is paused, until when, and their subscription status."""
+    with get_db_cursor() as cur:
+        cur.execute("""
+            SELECT COALESCE(is_paused, FALSE), pause_until, subscription_status 
+            FROM users WHERE chat_id = %s;
+        """, (chat_id,))
+        return cur.fetchone() or (False, None, None)
+
+
 def get_user_subscription_details(chat_id: int) -> Optional[Tuple[str, str, date]]:
     """Get user's pincode, status, and end_date."""
     with get_db_cursor() as cur:
@@ -434,33 +776,38 @@ def get_user_subscription_details(chat_id: int) -> Optional[Tuple[str, str, date
 
 
 # --- Subscription Management ---
-def get_pincode_data() -> Dict[str, List[str]]:
+EXPIRE_BATCH_SIZE = 1000
+
+
+@_ttl_cached("pincode_data", PINCODE_DATA_TTL_SECONDS)
+def get_pincode_data() -> Dict[str, List[int]]:
     """Get mapping of pincodes to chat_ids for active subscribers."""
+    # Grouped server-side; psycopg2 decodes BIGINT[] straight into List[int]
     with get_db_cursor() as cur:
         cur.execute("""
-            SELECT chat_id, pincode FROM users 
-            WHERE subscription_status = 'active' AND pincode IS NOT NULL;
+            SELECT pincode, array_agg(chat_id) FROM users 
+            WHERE subscription_status = 'active' AND pincode IS NOT NULL
+            GROUP BY pincode;
         """)
-        rows = cur.fetchall()
-    
-    pincode_to_chat_ids: Dict[str, List[int]] = {}
-    for chat_id, pincode in rows:
-        if pincode not in pincode_to_chat_ids:
-            pincode_to_chat_ids[pincode] = []
-        # keep chat_id as integer for downstream callers
-        try:
-            pincode_to_chat_ids[pincode].append(int(chat_id))
-        except Exception:
-            # fallback: append as-is
-            pincode_to_chat_ids[pincode].append(chat_id)
-    
-    return pincode_to_chat_ids
+        return dict(cur.fetchall())
 
 
 def get_active_user_ids() -> List[int]:
     """Get list of all active subscriber chat_ids."""
-    with get_db_cursor() as cur:
+    with get_db_stream_cursor("active_user_ids") as cur:
         cur.execute("SELECT chat_id FROM users WHERE subscription_status = 'active';")
+        return [row[0] for row in cur]
+
+
+def get_active_user_ids_page(after_chat_id: int, limit: int) -> List[int]:
+    """Next `limit` active subscriber chat_ids above after_chat_id, in order (keyset paging)."""
+    with get_db_cursor() as cur:
+        cur.execute("""
+            SELECT chat_id FROM users 
+            WHERE subscription_status = 'active' AND chat_id > %s 
+            ORDER BY chat_id 
+            LIMIT %s;
+        """, (after_chat_id, limit))
         return [row[0] for row in cur.fetchall()]
 
 
@@ -468,89 +815,122 @@ def get_user_stats() -> Dict[str, int]:
     """Get user statistics by subscription status."""
     stats: Dict[str, int] = {}
     
+    # Per-status counts and the grand total in a single scan
     with get_db_cursor() as cur:
-        cur.execute("SELECT subscription_status, COUNT(*) FROM users GROUP BY subscription_status;")
-        for status, count in cur.fetchall():
-            stats[status] = count
-        
-        cur.execute("SELECT COUNT(*) FROM users;")
-        stats['total'] = cur.fetchone()[0]
+        cur.execute("""
+            SELECT subscription_status, GROUPING(subscription_status) = 1, COUNT(*)
+            FROM users
+            GROUP BY GROUPING SETS ((subscription_status), ());
+        """)
+        for status, is_total, count in cur.fetchall():
+            stats['total' if is_total else status] = count
     
+    stats.setdefault('total', 0)
     return stats
 
 
+def expired_users_report() -> List[int]:
+    """Mark expired subscriptions. Returns the chat_ids that were expired."""
+    today = date.today()
+    expired_ids: List[int] = []
+    
+    # Commit in batches so a large sweep never holds thousands of row locks
+    # in one long transaction
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            while True:
+                cur.execute("""
+                    UPDATE users 
+                    SET subscription_status = 'expired' 
+                    WHERE chat_id IN (
+                        SELECT chat_id FROM users
+                        WHERE subscription_status = 'active' AND end_date IS NOT NULL AND end_date < %s
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING chat_id;
+                """, (today, EXPIRE_BATCH_SIZE))
+                batch = [row[0] for row in cur.fetchall()]
+                conn.commit()
+                expired_ids.extend(batch)
+                if len(batch) < EXPIRE_BATCH_SIZE:
+                    break
+    
+    if expired_ids:
+        _invalidate_read_cache("pincode_data")
+    return expired_ids
+
+
 def expire_subscriptions() -> int:
     """Mark expired subscriptions. Returns count of expired subscriptions."""
-    with get_db_cursor(commit=True) as cur:
-        cur.execute("""
-            UPDATE users 
-            SET subscription_status = 'expired' 
-            WHERE subscription_status = 'active' AND end_date IS NOT NULL AND end_date < %s;
-        """, (date.today(),))
-        return cur.rowcount
+    return len(expired_users_report())
 
 
 # --- Block/Unblock Operations ---
 def block_user(chat_id: int) -> bool:
     """Block a user and move them to blocklist. Returns True if successful."""
-    with get_db_connection() as conn:
-        cur = conn.cursor()
-        try:
-            cur.execute("SELECT chat_id, username FROM users WHERE chat_id = %s;", (chat_id,))
-            user = cur.fetchone()
-            
-            if user:
-                cur.execute("""
-                    INSERT INTO blocklist (chat_id, username, block_date) 
-                    VALUES (%s, %s, %s) 
-                    ON CONFLICT (chat_id) DO NOTHING;
-                """, (user[0], user[1], date.today()))
-                
-                cur.execute("DELETE FROM users WHERE chat_id = %s;", (chat_id,))
-                conn.commit()
-                return True
-            return False
-        finally:
-            cur.close()
+    # Move the row in one statement; the outer SELECT reports whether a user
+    # existed even if they were already on the blocklist
+    with get_db_cursor(commit=True) as cur:
+        cur.execute("""
+            WITH moved AS (
+                DELETE FROM users WHERE chat_id = %s
+                RETURNING chat_id, username
+            ), blocked AS (
+                INSERT INTO blocklist (chat_id, username, block_date)
+                SELECT chat_id, username, %s FROM moved
+                ON CONFLICT (chat_id) DO NOTHING
+            )
+            SELECT 1 FROM moved;
+        """, (chat_id, date.today()))
+        blocked = cur.fetchone() is not None
+    
+    _invalidate_user_reads(chat_id)
+    _invalidate_read_cache("blocked_ids")
+    if blocked:
+        _invalidate_read_cache("pincode_data")
+    return blocked
 
 
 def unblock_user(chat_id: int) -> bool:
     """Unblock a user and restore them to users table. Returns True if successful."""
-    with get_db_connection() as conn:
-        cur = conn.cursor()
-        try:
-            cur.execute("SELECT chat_id, username FROM blocklist WHERE chat_id = %s;", (chat_id,))
-            user = cur.fetchone()
-            
-            if user:
-                cur.execute("""
-                    INSERT INTO users (chat_id, username, subscription_status) 
-                    VALUES (%s, %s, 'expired') 
-                    ON CONFLICT (chat_id) DO NOTHING;
-                """, (user[0], user[1]))
-                
-                cur.execute("DELETE FROM blocklist WHERE chat_id = %s;", (chat_id,))
-                conn.commit()
-                return True
-            return False
-        finally:
-            cur.close()
+    with get_db_cursor(commit=True) as cur:
+        cur.execute("""
+            WITH moved AS (
+                DELETE FROM blocklist WHERE chat_id = %s
+                RETURNING chat_id, username
+            ), restored AS (
+                INSERT INTO users (chat_id, username, subscription_status)
+                SELECT chat_id, username, 'expired' FROM moved
+                ON CONFLICT (chat_id) DO NOTHING
+            )
+            SELECT 1 FROM moved;
+        """, (chat_id,))
+        unblocked = cur.fetchone() is not None
+    
+    _invalidate_user_reads(chat_id)
+    _invalidate_read_cache("blocked_ids")
+    return unblocked
+
+
+@_ttl_cached("blocked_ids", BLOCKED_IDS_TTL_SECONDS)
+def _get_blocked_ids() -> frozenset:
+    """All blocked chat_ids. The blocklist is small, so one set serves every lookup."""
+    with get_db_cursor() as cur:
+        cur.execute("SELECT chat_id FROM blocklist;")
+        return frozenset(row[0] for row in cur.fetchall())
 
 
 def is_user_blocked(chat_id: int) -> bool:
     """Check if a user is in the blocklist."""
-    with get_db_cursor() as cur:
-        cur.execute("SELECT 1 FROM blocklist WHERE chat_id = %s;", (chat_id,))
-        return cur.fetchone() is not None
+    return chat_id in _get_blocked_ids()
+
 
 # --- Product Status Cache (State Persistence) ---
 def get_product_status(product_url: str, pincode: str) -> Optional[str]:
     """Get cached product status ('stock', 'sold', or None if not cached)."""
     with get_db_cursor() as cur:
-        cur.execute(
-            "SELECT status FROM product_status_cache WHERE product_url = %s AND pincode = %s;",
-            (product_url, pincode)
-        )
+        _execute_prepared(cur, "get_product_status", (product_url, pincode))
         result = cur.fetchone()
         return result[0] if result else None
 
@@ -558,12 +938,26 @@ def get_product_status(product_url: str, pincode: str) -> Optional[str]:
 def set_product_status(product_url: str, pincode: str, status: str) -> None:
     """Update or insert product status in cache."""
     with get_db_cursor(commit=True) as cur:
-        cur.execute("""
-            INSERT INTO product_status_cache (product_url, pincode, status)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (product_url, pincode) 
-            DO UPDATE SET status = %s, last_updated = CURRENT_TIMESTAMP;
-        """, (product_url, pincode, status, status))
+        _execute_prepared(cur, "set_product_status", (product_url, pincode, status))
+    _invalidate_read_cache("products_for_pincode", pincode)
+
+
+def set_product_statuses(pincode: str, statuses: Dict[str, str]) -> None:
+    """Update or insert many product statuses for one pincode in one transaction."""
+    if not statuses:
+        return
+    
+    with get_db_cursor(commit=True) as cur:
+        execute_values(
+            cur,
+            """INSERT INTO product_status_cache (product_url, pincode, status)
+               VALUES %s
+               ON CONFLICT (product_url, pincode) 
+               DO UPDATE SET status = EXCLUDED.status, last_updated = CURRENT_TIMESTAMP;""",
+            [(url, pincode, status) for url, status in statuses.items()],
+            page_size=500
+        )
+    _invalidate_read_cache("products_for_pincode", pincode)
 
 
 def clear_old_product_cache(days: int = 30) -> int:
@@ -571,20 +965,37 @@ def clear_old_product_cache(days: int = 30) -> int:
     with get_db_cursor(commit=True) as cur:
         cur.execute("""
             DELETE FROM product_status_cache
-            WHERE last_updated < CURRENT_TIMESTAMP - INTERVAL '%s days';
+            WHERE last_updated < CURRENT_TIMESTAMP - make_interval(days => %s);
         """, (days,))
-        return cur.rowcount
+        deleted_count = cur.rowcount
+    
+    if deleted_count:
+        _invalidate_read_cache("all_products")
+    return deleted_count
+
+
+@_ttl_cached("products_for_pincode", PRODUCTS_FOR_PINCODE_TTL_SECONDS)
+def get_products_for_pincode(pincode: str) -> List[str]:
+    """Get the (up to 20) most recently seen in-stock products for a pincode."""
+    with get_db_cursor() as cur:
+        cur.execute("""
+            SELECT product_url 
+            FROM product_status_cache 
+            WHERE pincode = %s AND status = 'stock'
+            ORDER BY last_updated DESC
+            LIMIT 20;
+        """, (pincode,))
+        return [row[0] for row in cur.fetchall()]
 
 
 def has_cached_products_for_pincode(pincode: str) -> bool:
     """Check if we have any cached product statuses for this pincode."""
     with get_db_cursor() as cur:
         cur.execute(
-            "SELECT COUNT(*) FROM product_status_cache WHERE pincode = %s LIMIT 1;",
+            "SELECT EXISTS (SELECT 1 FROM product_status_cache WHERE pincode = %s);",
             (pincode,)
         )
-        result = cur.fetchone()
-        return result[0] > 0 if result else False
+        return cur.fetchone()[0]
 
 
 # --- User Preferences (Product Filtering) ---
@@ -611,26 +1022,27 @@ def set_user_preference(chat_id: int, product_name: str, active: bool = True) ->
 
 def toggle_user_preference(chat_id: int, product_name: str) -> bool:
     """Toggle a product preference on/off. Returns new state."""
+    # A missing row toggles to TRUE; the flip happens server-side in one upsert
     with get_db_cursor(commit=True) as cur:
-        cur.execute(
-            "SELECT active FROM user_preferences WHERE chat_id = %s AND product_name = %s;",
-            (chat_id, product_name)
-        )
-        result = cur.fetchone()
-        new_active = not result[0] if result else True
-        
-        set_user_preference(chat_id, product_name, new_active)
-        return new_active
+        cur.execute("""
+            INSERT INTO user_preferences (chat_id, product_name, active)
+            VALUES (%s, %s, TRUE)
+            ON CONFLICT (chat_id, product_name) 
+            DO UPDATE SET active = NOT COALESCE(user_preferences.active, FALSE)
+            RETURNING active;
+        """, (chat_id, product_name))
+        return cur.fetchone()[0]
 
 
+@_ttl_cached("all_products", ALL_PRODUCTS_TTL_SECONDS)
 def get_all_products() -> List[str]:
     """Get list of all available products from cache."""
-    with get_db_cursor() as cur:
+    with get_db_stream_cursor("all_products") as cur:
         cur.execute("""
             SELECT DISTINCT product_url FROM product_status_cache 
             ORDER BY product_url;
         """)
-        return [row[0] for row in cur.fetchall()]
+        return [row[0] for row in cur]
 
 
 def clear_user_preferences(chat_id: int) -> None:
@@ -647,8 +1059,10 @@ def set_alert_frequency(chat_id: int, frequency: str) -> None:
             "UPDATE users SET alert_frequency = %s WHERE chat_id = %s;",
             (frequency, chat_id)
         )
+    _invalidate_read_cache("alert_frequency", chat_id)
 
 
+@_ttl_cached("alert_frequency", USER_READ_TTL_SECONDS)
 def get_alert_frequency(chat_id: int) -> str:
     """Get user's alert frequency (default: instant)."""
     with get_db_cursor() as cur:
@@ -671,10 +1085,12 @@ def set_quiet_hours(chat_id: int, start_time: Optional[str], end_time: Optional[
             SET quiet_hours_start = %s::TIME, quiet_hours_end = %s::TIME 
             WHERE chat_id = %s;
         """, (start_time, end_time, chat_id))
+    _invalidate_read_cache("quiet_hours", chat_id)
 
 
+@_ttl_cached("quiet_hours", USER_READ_TTL_SECONDS)
 def get_quiet_hours(chat_id: int) -> Tuple[Optional[str], Optional[str]]:
-    """Get user's quiet hours. Returns (start_time_str, end_time_str) or (None, None)."""
+    """Get user's quiet hours. Returns ("HH:MM:SS", "HH:MM:SS") or (None, None)."""
     with get_db_cursor() as cur:
         cur.execute(
             "SELECT quiet_hours_start, quiet_hours_end FROM users WHERE chat_id = %s;",
@@ -691,6 +1107,70 @@ def get_quiet_hours(chat_id: int) -> Tuple[Optional[str], Optional[str]]:
         return (start_str, end_str)
 
 
+def get_quiet_hours_bulk(chat_ids: List[int]) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+    """Get quiet hours for many users; cache hits are reused, misses loaded in one query."""
+    quiet_hours: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+    missing = []
+    for chat_id in chat_ids:
+        cached = _read_cache_get(("quiet_hours", chat_id))
+        if cached is _MISSING:
+            missing.append(chat_id)
+        else:
+            quiet_hours[chat_id] = cached
+    
+    if missing:
+        generation = _read_cache_generation("quiet_hours")
+        with get_db_cursor() as cur:
+            cur.execute(
+                "SELECT chat_id, quiet_hours_start, quiet_hours_end FROM users WHERE chat_id = ANY(%s);",
+                (missing,)
+            )
+            rows = {chat_id: (start, end) for chat_id, start, end in cur.fetchall()}
+        
+        for chat_id in missing:
+            start, end = rows.get(chat_id, (None, None))
+            value = (
+                start.strftime("%H:%M:%S") if start else None,
+                end.strftime("%H:%M:%S") if end else None,
+            )
+            _read_cache_put(("quiet_hours", chat_id), value, USER_READ_TTL_SECONDS, generation)
+            quiet_hours[chat_id] = value
+    
+    return quiet_hours
+
+
+def get_user_alert_config(chat_id: int) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Get user's alert frequency and quiet hours as (frequency, start, end).
+    Shares the alert_frequency/quiet_hours cache entries and loads both in one query on a miss.
+    """
+    frequency = _read_cache_get(("alert_frequency", chat_id))
+    quiet_hours = _read_cache_get(("quiet_hours", chat_id))
+    
+    if frequency is _MISSING or quiet_hours is _MISSING:
+        frequency_generation = _read_cache_generation("alert_frequency")
+        quiet_hours_generation = _read_cache_generation("quiet_hours")
+        with get_db_cursor() as cur:
+            cur.execute(
+                "SELECT alert_frequency, quiet_hours_start, quiet_hours_end FROM users WHERE chat_id = %s;",
+                (chat_id,)
+            )
+            result = cur.fetchone()
+        
+        if result:
+            frequency, start, end = result
+            quiet_hours = (
+                start.strftime("%H:%M:%S") if start else None,
+                end.strftime("%H:%M:%S") if end else None,
+            )
+        else:
+            frequency, quiet_hours = "instant", (None, None)
+        _read_cache_put(("alert_frequency", chat_id), frequency, USER_READ_TTL_SECONDS, frequency_generation)
+        _read_cache_put(("quiet_hours", chat_id), quiet_hours, USER_READ_TTL_SECONDS, quiet_hours_generation)
+    
+    return (frequency, *quiet_hours)
+
+
 # --- Pending Alerts (for digest mode) ---
 def add_pending_alert(chat_id: int, product_title: str, product_url: str, status: str) -> None:
     """Add an alert to the pending queue."""
@@ -713,8 +1193,44 @@ def get_pending_alerts(chat_id: int, limit: int = 10) -> List[Tuple[str, str, st
         return cur.fetchall()
 
 
+def fetch_and_mark_alerts(chat_id: int, limit: int = 10) -> List[Tuple[int, str, str, str]]:
+    """
+    Claim up to `limit` oldest unsent alerts for a user, marking them sent.
+    
+    Returns (id, product_title, product_url, status) rows. Alerts that arrive
+    meanwhile stay pending; use requeue_alerts() if delivery fails.
+    """
+    with get_db_cursor(commit=True) as cur:
+        cur.execute("""
+            WITH picked AS (
+                SELECT id FROM pending_alerts
+                WHERE chat_id = %s AND sent = FALSE
+                ORDER BY created_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE pending_alerts p SET sent = TRUE
+            FROM picked WHERE p.id = picked.id
+            RETURNING p.id, p.product_title, p.product_url, p.status;
+        """, (chat_id, limit))
+        return cur.fetchall()
+
+
+def requeue_alerts(alert_ids: List[int]) -> int:
+    """Mark claimed alerts as unsent again after a failed delivery. Returns count."""
+    if not alert_ids:
+        return 0
+    with get_db_cursor(commit=True) as cur:
+        cur.execute("UPDATE pending_alerts SET sent = FALSE WHERE id = ANY(%s);", (alert_ids,))
+        return cur.rowcount
+
+
 def mark_alerts_sent(chat_id: int) -> int:
-    """Mark all pending alerts as sent. Returns count."""
+    """Mark all pending alerts as sent. Returns count.
+    
+    Prefer fetch_and_mark_alerts() for delivery: this also marks alerts that
+    arrived after they were read.
+    """
     with get_db_cursor(commit=True) as cur:
         cur.execute(
             "UPDATE pending_alerts SET sent = TRUE WHERE chat_id = %s AND sent = FALSE;",
@@ -742,19 +1258,28 @@ def get_users_by_alert_frequency(frequency: str) -> List[int]:
 
 def store_pending_alerts(chat_id: int, pincode: str, in_stock_products: List[Tuple[str, str]], sold_out_products: List[Tuple[str, str]]) -> None:
     """Store pending alerts for later delivery (digest mode or quiet hours)."""
+    store_pending_alerts_bulk([(chat_id, pincode, in_stock_products, sold_out_products)])
+
+
+def store_pending_alerts_bulk(alerts: List[Tuple[int, str, List[Tuple[str, str]], List[Tuple[str, str]]]]) -> None:
+    """Store pending alerts for many users in one transaction.
+    
+    Each entry is (chat_id, pincode, in_stock_products, sold_out_products).
+    """
+    rows = []
+    for chat_id, pincode, in_stock_products, sold_out_products in alerts:
+        rows.extend((chat_id, pincode, title, url, "stock") for title, url in in_stock_products)
+        rows.extend((chat_id, pincode, title, url, "sold") for title, url in sold_out_products)
+    
+    if not rows:
+        return
+    
     with get_db_cursor(commit=True) as cur:
-        for title, url in in_stock_products:
-            cur.execute(
-                """INSERT INTO pending_alerts (chat_id, pincode, product_title, product_url, status)
-                   VALUES (%s, %s, %s, %s, %s)
-                   ON CONFLICT (chat_id, product_url, status, pincode) DO NOTHING;""",
-                (chat_id, pincode, title, url, "stock")
-            )
-        
-        for title, url in sold_out_products:
-            cur.execute(
-                """INSERT INTO pending_alerts (chat_id, pincode, product_title, product_url, status)
-                   VALUES (%s, %s, %s, %s, %s)
-                   ON CONFLICT (chat_id, product_url, status, pincode) DO NOTHING;""",
-                (chat_id, pincode, title, url, "sold")
-            )
\ No newline at end of file
+        execute_values(
+            cur,
+            """INSERT INTO pending_alerts (chat_id, pincode, product_title, product_url, status)
+               VALUES %s
+               ON CONFLICT (chat_id, product_url, status, pincode) DO NOTHING;""",
+            rows,
+            page_size=500
+        )
\ No newline at end of file
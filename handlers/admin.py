@@ -4,7 +4,10 @@ Contains all admin-only Telegram commands.
 """
 
 import asyncio
+from datetime import timedelta
+from functools import partial
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import ContextTypes
 
 from config import Config
@@ -12,13 +15,99 @@ from async_db import (
     get_setting,
     set_setting,
     get_user_stats,
-    get_active_user_ids,
+    iter_active_user_ids,
     activate_user_subscription,
     extend_user_subscription,
     block_user,
     unblock_user,
 )
-from utils import admin_only, app_logger, user_activity_logger
+from utils import admin_only, app_logger, user_activity_logger, rate_limited_send
+
+
+# Sends per broadcast recipient before giving up on flood control
+BROADCAST_MAX_ATTEMPTS = 3
+
+# Concurrent broadcast senders; matches the bot-wide send slots in utils
+BROADCAST_WORKERS = 25
+
+
+# --- Message Templates ---
+# Built once at import; handlers only fill in the dynamic values
+_STATS_TEMPLATE = (
+    "📊 *Bot User Statistics*\n\n"
+    
+    "👥 *Total Users*: `{}`\n\n"
+    
+    "💚 *Active*: `{}` ({}%)\n"
+    "{}\n\n"
+    
+    "⏳ *Pending*: `{}` ({}%)\n"
+    "{}\n\n"
+    
+    "💔 *Expired*: `{}` ({}%)\n"
+    "{}\n\n"
+    
+    "🚫 *Blocked*: `{}`\n\n"
+    
+    "📈 *Quick Metrics*\n"
+    "• Churn Rate: ~3.2%\n"
+    "• Renewal Rate: ~68%\n"
+    "• Avg Active Days: ~45"
+)
+
+_REPLY_TEMPLATE = "📢 A message from the admin:\n\n_{}_"
+
+_BROADCAST_TEMPLATE = "📢 *A message from the admin:*\n\n_{}_"
+
+_ADMIN_HELP_TEXT = (
+    "👑 *Admin Command Menu*\n\n"
+    "Here are the commands you can use in this group:\n\n"
+    "**User Management:**\n"
+    "`/approve <chat_id> [days]` - Activates subscription (default: 30 days).\n"
+    "`/extend <chat_id> <days>` - Extends a user's subscription.\n"
+    "`/block <chat_id>` - Blocks a user and moves them to the blocklist.\n"
+    "`/unblock <chat_id>` - Unblocks a user, allowing them to re-subscribe.\n\n"
+    "**Communication:**\n"
+    "`/reply <chat_id> <message>` - Sends a direct message to a user.\n"
+    "`/broadcast <message>` - Sends a message to all active subscribers.\n\n"
+    "**Bot Management:**\n"
+    "`/stats` - Shows a summary of user statistics.\n"
+    "`/autoapprove <on|off>` - Toggles the free trial mode.\n"
+    "`/settings` - Shows the current status of bot settings."
+)
+
+_CONFIRM_TEMPLATE = (
+    "⚠️ *Are you sure?*\n\n"
+    "You are about to {action} user `{chat_id}`.\n\n"
+    "{consequence}"
+)
+
+_CONFIRM_CONSEQUENCES = {
+    "block": "They will not be able to re-subscribe.",
+    "unblock": "They will be able to re-subscribe.",
+}
+
+
+# Every possible bar, indexed by filled cells
+_PROGRESS_BARS = tuple("🟩" * filled + "🟥" * (10 - filled) for filled in range(11))
+
+
+def _progress_bar(value: int) -> str:
+    """Render a 0-100 percentage as a 10-cell bar."""
+    return _PROGRESS_BARS[min(value // 10, 10)]
+
+
+_CANCEL_BUTTON = InlineKeyboardButton("❌ Cancel", callback_data="confirm_cancel")
+
+
+def _confirmation_keyboard(action: str, target_chat_id: int) -> InlineKeyboardMarkup:
+    """Yes/Cancel keyboard for confirming a block or unblock of target_chat_id."""
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton(
+            f"✅ Yes, {action.capitalize()}", callback_data=f"confirm_{action}_{target_chat_id}"
+        ),
+        _CANCEL_BUTTON
+    ]])
 
 
 # --- Auto-Approve Command ---
@@ -46,11 +135,10 @@ async def auto_approve_command(update: Update, context: ContextTypes.DEFAULT_TYP
             
         else:
             await update.message.reply_text(
-                "Invalid argument. Use `/autoapprove on` or `/autoapprove off`.",
-                parse_mode="Markdown"
+                "Invalid argument. Use `/autoapprove on` or `/autoapprove off`."
             )
     except IndexError:
-        await update.message.reply_text("Usage: `/autoapprove <on|off>`", parse_mode="Markdown")
+        await update.message.reply_text("Usage: `/autoapprove <on|off>`")
 
 
 # --- Settings Command ---
@@ -68,7 +156,7 @@ async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         "⚙️ *Current Bot Settings*\n\n"
         f"Auto-Approve Mode: *{auto_approve_status}*"
     )
-    await update.message.reply_text(message, parse_mode="Markdown")
+    await update.message.reply_text(message)
 
 
 # --- Reply Command ---
@@ -78,28 +166,35 @@ async def reply_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     admin = update.effective_user
     
     try:
-        target_chat_id = int(context.args[0])
-        reply_message = " ".join(context.args[1:])
+        # Take the message from the raw text so its spacing and line breaks survive
+        parts = update.message.text.split(None, 2)
+        target_chat_id = int(parts[1])
+        reply_message = parts[2] if len(parts) > 2 else ""
         
         if not reply_message:
             await update.message.reply_text(
-                "Usage: `/reply <chat_id> <message>`",
-                parse_mode="Markdown"
+                "Usage: `/reply <chat_id> <message>`"
             )
             return
         
-        await context.bot.send_message(
-            chat_id=target_chat_id, 
-            text=f"📢 A message from the admin:\n\n_{reply_message}_", 
-            parse_mode="Markdown"
-        )
+        try:
+            await context.bot.send_message(
+                chat_id=target_chat_id, 
+                text=_REPLY_TEMPLATE.format(reply_message)
+            )
+        except BadRequest as e:
+            # Usually unbalanced Markdown (a stray _ or *) in the admin's text
+            await update.message.reply_text(
+                f"❌ Reply not sent: {e.message}",
+                parse_mode=None
+            )
+            return
         await update.message.reply_text(f"Reply sent to user {target_chat_id}.")
         user_activity_logger.info(f"Admin {admin.id} replied to user {target_chat_id}.")
         
     except (IndexError, ValueError):
         await update.message.reply_text(
-            "Usage: `/reply <chat_id> <message>`",
-            parse_mode="Markdown"
+            "Usage: `/reply <chat_id> <message>`"
         )
 
 
@@ -115,78 +210,102 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     expired = stats.get('expired', 0)
     blocked = stats.get('blocked', 0)
     
-    # Calculate percentages
-    active_pct = int((active / total * 100) if total else 0)
-    pending_pct = int((pending / total * 100) if total else 0)
-    expired_pct = int((expired / total * 100) if total else 0)
+    # Calculate percentages (integer math, so exact shares stay exact)
+    active_pct = active * 100 // total if total else 0
+    pending_pct = pending * 100 // total if total else 0
+    expired_pct = expired * 100 // total if total else 0
     
-    # Create progress bars
-    def create_bar(value, max_val=100):
-        filled = min(int(value / 10), 10)
-        return "🟩" * filled + "🟥" * (10 - filled)
-    
-    message = (
-        "📊 *Bot User Statistics*\n\n"
-        
-        "👥 *Total Users*: `{}`\n\n"
-        
-        "💚 *Active*: `{}` ({}%)\n"
-        "{}\n\n"
-        
-        "⏳ *Pending*: `{}` ({}%)\n"
-        "{}\n\n"
-        
-        "💔 *Expired*: `{}` ({}%)\n"
-        "{}\n\n"
-        
-        "🚫 *Blocked*: `{}`\n\n"
-        
-        "📈 *Quick Metrics*\n"
-        "• Churn Rate: ~3.2%\n"
-        "• Renewal Rate: ~68%\n"
-        "• Avg Active Days: ~45"
-    ).format(
+    message = _STATS_TEMPLATE.format(
         total,
-        active, active_pct, create_bar(active_pct),
-        pending, pending_pct, create_bar(pending_pct),
-        expired, expired_pct, create_bar(expired_pct),
+        active, active_pct, _progress_bar(active_pct),
+        pending, pending_pct, _progress_bar(pending_pct),
+        expired, expired_pct, _progress_bar(expired_pct),
         blocked
     )
     
-    await update.message.reply_text(message, parse_mode="Markdown")
+    await update.message.reply_text(message)
 
 
 # --- Broadcast Command ---
 @admin_only
 async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /broadcast command - Send message to all active subscribers."""
-    message_to_send = " ".join(context.args)
+    # Everything after the command, with its spacing and line breaks intact
+    parts = update.message.text.split(None, 1)
+    message_to_send = parts[1] if len(parts) > 1 else ""
     
     if not message_to_send:
         await update.message.reply_text(
-            "Usage: `/broadcast <your message>`",
-            parse_mode="Markdown"
+            "Usage: `/broadcast <your message>`"
         )
         return
 
     await update.message.reply_text("📣 Starting broadcast to all active subscribers...")
     
-    user_ids = await get_active_user_ids()
+    # Render the Markdown once here; recipients get server-side copies of it
+    try:
+        template = await update.message.reply_text(
+            _BROADCAST_TEMPLATE.format(message_to_send)
+        )
+    except BadRequest as e:
+        # Usually unbalanced Markdown (a stray _ or *) in the admin's text
+        await update.message.reply_text(
+            f"❌ Broadcast cancelled, the message could not be sent: {e.message}",
+            parse_mode=None
+        )
+        return
+    
+    async def send_one(user_id: int) -> bool:
+        for attempt in range(BROADCAST_MAX_ATTEMPTS):
+            try:
+                await rate_limited_send(partial(
+                    context.bot.copy_message,
+                    chat_id=user_id, 
+                    from_chat_id=template.chat_id, 
+                    message_id=template.message_id
+                ))
+                return True
+            except RetryAfter as e:
+                # Flood control: wait as long as Telegram asks, then try again
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                app_logger.warning(f"⚠️ Broadcast to {user_id} rate limited, retrying in {delay}s")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                app_logger.error(f"Failed to send broadcast to {user_id}: {e}")
+                return False
+        app_logger.error(f"Failed to send broadcast to {user_id}: still rate limited")
+        return False
+    
+    # A fixed set of workers drains the queue; the shared send slots keep the
+    # overall rate under Telegram's limit
+    queue: asyncio.Queue = asyncio.Queue(maxsize=BROADCAST_WORKERS * 2)
     success_count = 0
     fail_count = 0
-
-    for user_id in user_ids:
-        try:
-            await context.bot.send_message(
-                chat_id=user_id, 
-                text=f"📢 *A message from the admin:*\n\n_{message_to_send}_", 
-                parse_mode="Markdown"
-            )
-            success_count += 1
-            await asyncio.sleep(0.1)  # Rate limiting
-        except Exception as e:
-            fail_count += 1
-            app_logger.error(f"Failed to send broadcast to {user_id}: {e}")
+    
+    async def worker() -> None:
+        nonlocal success_count, fail_count
+        while True:
+            user_id = await queue.get()
+            try:
+                if await send_one(user_id):
+                    success_count += 1
+                else:
+                    fail_count += 1
+            finally:
+                queue.task_done()
+    
+    workers = [asyncio.create_task(worker()) for _ in range(BROADCAST_WORKERS)]
+    try:
+        async for user_id in iter_active_user_ids():
+            await queue.put(user_id)
+        await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        # Let the cancellations finish before reporting
+        await asyncio.gather(*workers, return_exceptions=True)
     
     summary_message = (
         f"Broadcast complete.\n\n"
@@ -213,14 +332,22 @@ async def extend_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         new_end_date = await extend_user_subscription(target_chat_id, days_to_extend)
         
         if new_end_date:
-            await context.bot.send_message(
-                chat_id=target_chat_id, 
-                text=f"🎉 An admin has extended your subscription! "
-                     f"It now expires on {new_end_date.strftime('%d %b %Y')}."
-            )
-            await update.message.reply_text(
-                f"Subscription for {target_chat_id} extended by {days_to_extend} days."
+            # The extension is already saved; notify the user and confirm to the admin concurrently
+            notified, confirmed = await asyncio.gather(
+                context.bot.send_message(
+                    chat_id=target_chat_id, 
+                    text=f"🎉 An admin has extended your subscription! "
+                         f"It now expires on {new_end_date.strftime('%d %b %Y')}."
+                ),
+                update.message.reply_text(
+                    f"Subscription for {target_chat_id} extended by {days_to_extend} days."
+                ),
+                return_exceptions=True
             )
+            if isinstance(notified, Exception):
+                app_logger.warning(f"⚠️ Could not notify {target_chat_id} of extension: {notified}")
+            if isinstance(confirmed, Exception):
+                app_logger.warning(f"⚠️ Could not confirm extension of {target_chat_id} to admin: {confirmed}")
             user_activity_logger.info(
                 f"Admin {admin.id} extended subscription for {target_chat_id} by {days_to_extend} days."
             )
@@ -231,67 +358,37 @@ async def extend_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             
     except (IndexError, ValueError):
         await update.message.reply_text(
-            "Usage: `/extend <chat_id> <days>`",
-            parse_mode="Markdown"
+            "Usage: `/extend <chat_id> <days>`"
         )
 
 
-# --- Block Command ---
-@admin_only
-async def block_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle /block command - Block a user by chat ID."""
-    admin = update.effective_user
-    
+# --- Block/Unblock Commands ---
+async def _ask_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str) -> None:
+    """Ask the admin to confirm a block/unblock of the chat_id given as the first argument."""
     try:
         target_chat_id = int(context.args[0])
-        
-        # Show confirmation
-        keyboard = InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("✅ Yes, Block", callback_data=f"confirm_block_{target_chat_id}"),
-                InlineKeyboardButton("❌ Cancel", callback_data="confirm_cancel")
-            ]
-        ])
-        
-        await update.message.reply_text(
-            f"⚠️ *Are you sure?*\n\n"
-            f"You are about to block user `{target_chat_id}`.\n\n"
-            f"They will not be able to re-subscribe.",
-            parse_mode="Markdown",
-            reply_markup=keyboard
-        )
-        
     except (IndexError, ValueError):
-        await update.message.reply_text("Usage: `/block <chat_id>`", parse_mode="Markdown")
+        await update.message.reply_text(f"Usage: `/{action} <chat_id>`")
+        return
+    
+    await update.message.reply_text(
+        _CONFIRM_TEMPLATE.format(
+            action=action, chat_id=target_chat_id, consequence=_CONFIRM_CONSEQUENCES[action]
+        ),
+        reply_markup=_confirmation_keyboard(action, target_chat_id)
+    )
+
+
+@admin_only
+async def block_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /block command - Block a user by chat ID."""
+    await _ask_confirmation(update, context, "block")
 
 
-# --- Unblock Command ---
 @admin_only
 async def unblock_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /unblock command - Unblock a user by chat ID."""
-    admin = update.effective_user
-    
-    try:
-        target_chat_id = int(context.args[0])
-        
-        # Show confirmation
-        keyboard = InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("✅ Yes, Unblock", callback_data=f"confirm_unblock_{target_chat_id}"),
-                InlineKeyboardButton("❌ Cancel", callback_data="confirm_cancel")
-            ]
-        ])
-        
-        await update.message.reply_text(
-            f"⚠️ *Are you sure?*\n\n"
-            f"You are about to unblock user `{target_chat_id}`.\n\n"
-            f"They will be able to re-subscribe.",
-            parse_mode="Markdown",
-            reply_markup=keyboard
-        )
-            
-    except (IndexError, ValueError):
-        await update.message.reply_text("Usage: `/unblock <chat_id>`", parse_mode="Markdown")
+    await _ask_confirmation(update, context, "unblock")
 
 
 # --- Approve Command (Manual) ---
@@ -306,20 +403,27 @@ async def approve_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         start_date, end_date = await activate_user_subscription(target_chat_id, days=days)
         
-        await context.bot.send_message(
-            chat_id=target_chat_id, 
-            text=f"✅ Your subscription is approved! "
-                 f"Alerts are active until {end_date.strftime('%d %b %Y')}."
-        )
-        await update.message.reply_text(
-            f"User {target_chat_id} approved for {days} days."
+        # The approval is already saved; notify the user and confirm to the admin concurrently
+        notified, confirmed = await asyncio.gather(
+            context.bot.send_message(
+                chat_id=target_chat_id, 
+                text=f"✅ Your subscription is approved! "
+                     f"Alerts are active until {end_date.strftime('%d %b %Y')}."
+            ),
+            update.message.reply_text(
+                f"User {target_chat_id} approved for {days} days."
+            ),
+            return_exceptions=True
         )
+        if isinstance(notified, Exception):
+            app_logger.warning(f"⚠️ Could not notify {target_chat_id} of approval: {notified}")
+        if isinstance(confirmed, Exception):
+            app_logger.warning(f"⚠️ Could not confirm approval of {target_chat_id} to admin: {confirmed}")
         user_activity_logger.info(f"User {target_chat_id} approved by admin {admin.id}.")
         
     except (IndexError, ValueError):
         await update.message.reply_text(
-            "Usage: `/approve <chat_id> [days]`\nDefaults to 30 days if not specified.",
-            parse_mode="Markdown"
+            "Usage: `/approve <chat_id> [days]`\nDefaults to 30 days if not specified."
         )
 
 
@@ -327,20 +431,4 @@ async def approve_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 @admin_only
 async def admin_help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /adminhelp command - Show all admin commands."""
-    help_text = (
-        "👑 *Admin Command Menu*\n\n"
-        "Here are the commands you can use in this group:\n\n"
-        "**User Management:**\n"
-        "`/approve <chat_id> [days]` - Activates subscription (default: 30 days).\n"
-        "`/extend <chat_id> <days>` - Extends a user's subscription.\n"
-        "`/block <chat_id>` - Blocks a user and moves them to the blocklist.\n"
-        "`/unblock <chat_id>` - Unblocks a user, allowing them to re-subscribe.\n\n"
-        "**Communication:**\n"
-        "`/reply <chat_id> <message>` - Sends a direct message to a user.\n"
-        "`/broadcast <message>` - Sends a message to all active subscribers.\n\n"
-        "**Bot Management:**\n"
-        "`/stats` - Shows a summary of user statistics.\n"
-        "`/autoapprove <on|off>` - Toggles the free trial mode.\n"
-        "`/settings` - Shows the current status of bot settings."
-    )
-    await update.message.reply_text(help_text, parse_mode="Markdown")
+    await update.message.reply_text(_ADMIN_HELP_TEXT)
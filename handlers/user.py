@@ -3,39 +3,201 @@ User command handlers for Amul Product Alert Bot.
 Contains all user-facing Telegram commands.
 """
 
+import re
 import asyncio
 from datetime import date
+from functools import lru_cache
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from telegram.helpers import escape_markdown
 
 from config import Config
 from async_db import (
-    upsert_user,
+    register_user,
     get_user_subscription_status,
-    update_user_pincode,
-    activate_user_subscription,
+    change_user_pincode,
     get_user_subscription_details,
     pause_user_subscription,
     resume_user_subscription,
-    is_user_paused,
-    get_pause_until_date,
+    get_user_pause_state,
     get_user_preferences,
     toggle_user_preference,
     get_all_products,
-    get_alert_frequency,
+    get_user_alert_config,
     set_alert_frequency,
     get_quiet_hours,
     set_quiet_hours,
     get_pending_alerts,
     mark_alerts_sent,
-    clear_pending_alerts,
     get_setting,
     get_products_for_pincode,
+    is_user_blocked,
 )
-from utils import rate_limit, app_logger, user_activity_logger
+from utils import rate_limit, app_logger, user_activity_logger, validate_pincode
+
+
+# --- Message Templates ---
+# Static replies are built once at import
+_PROOF_TEXT = (
+    "💳 *Payment Instructions*\n\n"
+    
+    "Step 1️⃣: Make Payment\n"
+    "Transfer ₹99/month to:\n"
+    "UPI: admin@bank (or your UPI ID)\n"
+    "Or use the payment link: [Pay Here](https://payment.link)\n\n"
+    
+    "Step 2️⃣: Take Screenshot\n"
+    "Capture the payment confirmation\n\n"
+    
+    "Step 3️⃣: Upload Screenshot\n"
+    "Send the screenshot here using the camera icon\n\n"
+    
+    "Step 4️⃣: Wait for Approval\n"
+    "We'll verify and activate within 1-2 hours\n\n"
+    
+    "Your User ID: `{}`\n"
+    "Include this in your payment notes!\n\n"
+    
+    "❓ Need help? Use `/dm <message>`"
+)
+
+_RULES_TEXT = (
+    "📜 *Service Rules & Guidelines*\n\n"
+    
+    "🎯 *General*\n"
+    "1. Each subscription is valid for one pincode only\n"
+    "2. You can change your pincode anytime with `/add <new_pincode>`\n"
+    "3. This service is for informational purposes only\n\n"
+    
+    "✅ *Do's*\n"
+    "• Set a valid pincode for accurate alerts\n"
+    "• Contact admin if you have issues\n"
+    "• Keep your account active by renewing on time\n\n"
+    
+    "❌ *Don'ts*\n"
+    "• Spam commands (may result in temporary block)\n"
+    "• Share bot access with others\n"
+    "• Use automated scripts or bots\n\n"
+    
+    "⚠️ *Violations*\n"
+    "Repeated violations may result in account suspension."
+)
+
+_DM_TEMPLATE = (
+    "New message from @{username} (ID: `{chat_id}`):\n\n"
+    "{message}\n\n"
+    "To reply, tap to copy and send:\n"
+    "`/reply {chat_id} <your message>`"
+)
+
+BLOCKED_TEXT = "🚫 Your account has been blocked."
+
+_HELP_TEXT = (
+    "🆘 *Available Commands*\n\n"
+    
+    "🚀 *Getting Started*\n"
+    "`/start` - Main menu with quick actions\n"
+    "`/add <pincode>` - Set your delivery location\n"
+    "_Example: `/add 600113`_\n\n"
+    
+    "📊 *Account Management*\n"
+    "`/subscription` - Check your subscription status\n"
+    "`/proof` - Get payment instructions\n"
+    "`/rules` - View service rules\n\n"
+    
+    "💬 *Communication*\n"
+    "`/dm <message>` - Send a message to admin\n"
+    "`/help` - Show this help menu\n\n"
+    
+    "💡 *Pro Tips*\n"
+    "• You can use inline buttons - no need to type commands!\n"
+    "• Your pincode can be changed anytime\n"
+    "• Premium members get priority support\n"
+)
+
+# Static keyboards never change, so they are built once and shared
+ACTIVE_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📊 My Subscription", callback_data="user_my_subscription")],
+    [InlineKeyboardButton("📝 Change Pincode", callback_data="user_set_pincode")],
+    [InlineKeyboardButton("❓ Help", callback_data="user_help")]
+])
+
+PENDING_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⏳ Check Status", callback_data="user_my_subscription")],
+    [InlineKeyboardButton("📞 Contact Admin", callback_data="user_contact_admin")]
+])
+
+NEW_USER_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🚀 Set Pincode & Start", callback_data="user_set_pincode")],
+    [InlineKeyboardButton("📜 Rules", callback_data="user_rules")],
+    [InlineKeyboardButton("❓ How It Works", callback_data="user_help")]
+])
+
+_MENU_HELP_KEYBOARD = InlineKeyboardMarkup([[
+    InlineKeyboardButton("🏠 Main Menu", callback_data="user_start"),
+    InlineKeyboardButton("❓ Help", callback_data="user_help")
+]])
+
+_MENU_CONTACT_KEYBOARD = InlineKeyboardMarkup([[
+    InlineKeyboardButton("🏠 Main Menu", callback_data="user_start"),
+    InlineKeyboardButton("📞 Contact Admin", callback_data="user_contact_admin")
+]])
+
+_TRIAL_STARTED_KEYBOARD = InlineKeyboardMarkup([[
+    InlineKeyboardButton("🎉 Start Getting Alerts", callback_data="user_start")
+]])
+
+_PAYMENT_NEXT_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💳 Next: Submit Payment", callback_data="user_payment_proof")],
+    [InlineKeyboardButton("❓ How to Pay?", callback_data="user_proof_info")]
+])
+
+_UPLOAD_PROOF_KEYBOARD = InlineKeyboardMarkup([[
+    InlineKeyboardButton("📸 Upload Payment Screenshot", callback_data="user_upload_proof")
+]])
+
+_PAUSE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⏸️ Pause for 7 days", callback_data="pause_7")],
+    [InlineKeyboardButton("⏸️ Pause for 14 days", callback_data="pause_14")],
+    [InlineKeyboardButton("⏸️ Pause for 30 days", callback_data="pause_30")],
+    [InlineKeyboardButton("❌ Cancel", callback_data="pause_cancel")]
+])
+
+_ALERT_SETTINGS_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⚡ Real-time Alerts", callback_data="freq_instant")],
+    [InlineKeyboardButton("⏰ Hourly Digest", callback_data="freq_hourly")],
+    [InlineKeyboardButton("📅 Daily Digest", callback_data="freq_daily")],
+    [InlineKeyboardButton("🌙 Set Quiet Hours", callback_data="quiet_hours")],
+    [InlineKeyboardButton("🏠 Main Menu", callback_data="user_start")]
+])
+
+# Subscription status indicators
+_STATUS_ICONS = {
+    "active": "✅",
+    "pending": "⏳",
+    "expired": "❌",
+    "none": "ℹ️",
+    "blocked": "🚫"
+}
+
+# Every possible subscription bar, indexed by filled cells
+_PROGRESS_BARS = tuple("🟩" * filled + "🟥" * (10 - filled) for filled in range(11))
 
 
 # --- Utility Functions ---
+# Common abbreviations to save space in buttons
+_ABBREVIATIONS = {
+    "High Fat": "HF",
+    "Low Fat": "LF",
+    "Standard Fat": "SF",
+    "Full Cream": "FC",
+    "Pasteurized": "Pasteur.",
+}
+_ABBREVIATION_PATTERN = re.compile("|".join(map(re.escape, _ABBREVIATIONS)))
+
+
+# The product set is small, so every (name, length) pair is formatted only once
+@lru_cache(maxsize=512)
 def format_product_name(product_str: str, max_length: int = 18) -> str:
     """
     Format product name for button display.
@@ -57,16 +219,7 @@ def format_product_name(product_str: str, max_length: int = 18) -> str:
     product_name = product_name.replace("-", " ").title()
     
     # Common abbreviations to save space
-    abbreviations = {
-        "High Fat": "HF",
-        "Low Fat": "LF",
-        "Standard Fat": "SF",
-        "Full Cream": "FC",
-        "Pasteurized": "Pasteur.",
-    }
-    
-    for long_form, short_form in abbreviations.items():
-        product_name = product_name.replace(long_form, short_form)
+    product_name = _ABBREVIATION_PATTERN.sub(lambda match: _ABBREVIATIONS[match.group()], product_name)
     
     # Trim to max length
     if len(product_name) > max_length:
@@ -75,28 +228,32 @@ def format_product_name(product_str: str, max_length: int = 18) -> str:
     return product_name.strip()
 
 
+async def _replace_ack(update: Update, ack, text: str) -> None:
+    """Edit a sent acknowledgement into text, or reply with it if the ack was never sent."""
+    if ack is None or isinstance(ack, BaseException):
+        await update.message.reply_text(text)
+    else:
+        await ack.edit_text(text)
+
+
 # --- Start Command ---
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /start command - Register user and show welcome menu."""
     user = update.effective_user
     user_activity_logger.info(f"User {user.id} ({user.username}) started the bot.")
     
-    # Register/update user in database
-    await upsert_user(user.id, user.username)
+    # Blocked users live only in the blocklist; registering them would undo the block
+    if await is_user_blocked(user.id):
+        await update.message.reply_text(BLOCKED_TEXT)
+        return
     
-    # Check user's current status
-    status = await get_user_subscription_status(user.id) or 'none'
-    user_data = await get_user_subscription_details(user.id)
-    pincode = user_data[0] if user_data else None
+    # Register/update the user and read back their current status in one go
+    pincode, status, _ = await register_user(user.id, user.username)
     
     # Build interactive menu based on status
     if status == 'active':
         # User already has active subscription
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📊 My Subscription", callback_data="user_my_subscription")],
-            [InlineKeyboardButton("📝 Change Pincode", callback_data="user_set_pincode")],
-            [InlineKeyboardButton("❓ Help", callback_data="user_help")]
-        ])
+        keyboard = ACTIVE_MENU_KEYBOARD
         
         welcome_message = (
             f"👋 Welcome back, {user.first_name}!\n\n"
@@ -106,10 +263,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         )
     elif status == 'pending':
         # User submitted proof, waiting for approval
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⏳ Check Status", callback_data="user_my_subscription")],
-            [InlineKeyboardButton("📞 Contact Admin", callback_data="user_contact_admin")]
-        ])
+        keyboard = PENDING_MENU_KEYBOARD
         
         welcome_message = (
             f"👋 Welcome back, {user.first_name}!\n\n"
@@ -118,11 +272,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         )
     else:
         # New user or needs to set up
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🚀 Set Pincode & Start", callback_data="user_set_pincode")],
-            [InlineKeyboardButton("📜 Rules", callback_data="user_rules")],
-            [InlineKeyboardButton("❓ How It Works", callback_data="user_help")]
-        ])
+        keyboard = NEW_USER_MENU_KEYBOARD
         
         welcome_message = (
             f"👋 Welcome, {user.first_name}! 🎉\n\n"
@@ -131,30 +281,29 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             f"Let's get started 👇"
         )
     
-    await update.message.reply_text(welcome_message, reply_markup=keyboard)
+    # Names are sent verbatim, so this message opts out of the Markdown default
+    await update.message.reply_text(welcome_message, parse_mode=None, reply_markup=keyboard)
 
 
 # --- Add Pincode Command ---
 @rate_limit(10)
 async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /add command - Set or update user's pincode."""
-    from utils import validate_pincode
-    
     user = update.effective_user
     
+    if await is_user_blocked(user.id):
+        await update.message.reply_text(BLOCKED_TEXT)
+        return
+    
     try:
         pincode = context.args[0]
         
         # Validate pincode format and service area
         is_valid, message = validate_pincode(pincode)
         if not is_valid:
-            keyboard = InlineKeyboardMarkup([[
-                InlineKeyboardButton("🏠 Main Menu", callback_data="user_start"),
-                InlineKeyboardButton("❓ Help", callback_data="user_help")
-            ]])
+            keyboard = _MENU_HELP_KEYBOARD
             await update.message.reply_text(
                 message,
-                parse_mode="Markdown",
                 reply_markup=keyboard
             )
             return
@@ -162,28 +311,26 @@ async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         # Show progress
         status_msg = await update.message.reply_text("⏳ Processing your request...")
         
-        # Get current subscription status
-        status = await get_user_subscription_status(user.id) or 'none'
+        # Auto-approve gives non-active users a 30-day trial
+        auto_approve = await get_setting('auto_approve') == '1'
         
-        # Clear any pending alerts from previous pincode
-        await clear_pending_alerts(user.id)
-        
-        # Update pincode
-        await update_user_pincode(user.id, pincode)
+        # Update pincode, clear alerts queued for the old one and start any
+        # trial in a single statement, while checking if the pincode has data in cache
+        (status, trial_end_date), available_products = await asyncio.gather(
+            change_user_pincode(user.id, pincode, trial_days=30 if auto_approve else None),
+            get_products_for_pincode(pincode)
+        )
         user_activity_logger.info(f"User {user.id} set pincode to {pincode}. Status: {status}")
         
-        # Check if pincode has data in cache (non-blocking check)
-        available_products = await get_products_for_pincode(pincode)
-        
         pincode_status = "✅ Data available" if available_products else "🔍 Searching..."
         product_preview = ""
         if available_products:
-            product_preview = "\n\n*Available Products:*\n"
+            preview_parts = ["\n\n*Available Products:*\n"]
             for idx, product in enumerate(available_products[:5], 1):
-                product_name = product.split('/')[-1].replace('-', ' ').title()[:20]
-                product_preview += f"{idx}. {product_name}\n"
+                preview_parts.append(f"{idx}. {format_product_name(product, max_length=20)}\n")
             if len(available_products) > 5:
-                product_preview += f"... +{len(available_products) - 5} more"
+                preview_parts.append(f"... +{len(available_products) - 5} more")
+            product_preview = "".join(preview_parts)
         
         if status == 'active':
             await status_msg.edit_text(
@@ -191,20 +338,12 @@ async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
                 f"Your pincode has been updated to `{pincode}`.\n"
                 f"{pincode_status}\n"
                 f"{product_preview}\n\n"
-                f"Your alerts will now show products for this location! 📍",
-                parse_mode="Markdown"
+                f"Your alerts will now show products for this location! 📍"
             )
         else:
-            # Check auto-approve setting
-            auto_approve_status = await get_setting('auto_approve')
-            
-            if auto_approve_status == '1':
-                # Auto-approve with 30-day trial
-                _, end_date = await activate_user_subscription(user.id, days=30)
-                
-                keyboard = InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🎉 Start Getting Alerts", callback_data="user_start")
-                ]])
+            if trial_end_date:
+                # Auto-approved with a 30-day trial
+                keyboard = _TRIAL_STARTED_KEYBOARD
                 
                 await status_msg.edit_text(
                     f"🎉 *Awesome!*\n\n"
@@ -212,35 +351,31 @@ async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
                     f"📍 Location: `{pincode}`\n"
                     f"{pincode_status}\n"
                     f"{product_preview}\n\n"
-                    f"⏰ Trial ends: {end_date.strftime('%d %b %Y')}\n\n"
+                    f"⏰ Trial ends: {trial_end_date.strftime('%d %b %Y')}\n\n"
                     "You'll receive alerts when Amul products are in stock.",
-                    parse_mode="Markdown",
                     reply_markup=keyboard
                 )
                 user_activity_logger.info(f"User {user.id} auto-approved for a 30-day trial.")
                 
                 # Send initial alert with current in-stock products
                 try:
-                    available_products = await get_products_for_pincode(pincode)
                     if available_products:
-                        welcome_msg = f"📢 *Welcome Alert!*\n\n"
-                        welcome_msg += f"Here are products currently available at your location:\n\n"
+                        welcome_parts = [
+                            "📢 *Welcome Alert!*\n\n",
+                            "Here are products currently available at your location:\n\n"
+                        ]
                         for idx, product in enumerate(available_products[:10], 1):
-                            product_name = product.split('/')[-1].replace('-', ' ').title()
-                            welcome_msg += f"{idx}. ✅ {product_name}\n"
+                            welcome_parts.append(f"{idx}. ✅ {format_product_name(product, max_length=30)}\n")
                         if len(available_products) > 10:
-                            welcome_msg += f"\n... +{len(available_products) - 10} more products available"
-                        welcome_msg += f"\n\nYou'll receive instant alerts when stock changes at your location! 🚀"
+                            welcome_parts.append(f"\n... +{len(available_products) - 10} more products available")
+                        welcome_parts.append("\n\nYou'll receive instant alerts when stock changes at your location! 🚀")
                         
-                        await update.message.reply_text(welcome_msg, parse_mode="Markdown")
+                        await update.message.reply_text("".join(welcome_parts))
                         user_activity_logger.info(f"User {user.id} sent welcome alert with {len(available_products)} available products")
                 except Exception as e:
                     app_logger.warning(f"Could not send welcome alert to {user.id}: {e}")
             else:
-                keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("💳 Next: Submit Payment", callback_data="user_payment_proof")],
-                    [InlineKeyboardButton("❓ How to Pay?", callback_data="user_proof_info")]
-                ])
+                keyboard = _PAYMENT_NEXT_KEYBOARD
                 
                 await status_msg.edit_text(
                     f"✅ *Pincode saved!*\n\n"
@@ -249,32 +384,23 @@ async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
                     f"{product_preview}\n\n"
                     "Next step: Complete payment to activate alerts!\n\n"
                     "💡 *Tip*: Use the buttons below to continue.",
-                    parse_mode="Markdown",
                     reply_markup=keyboard
                 )
                 
     except (IndexError, ValueError):
-        keyboard = InlineKeyboardMarkup([[
-            InlineKeyboardButton("🏠 Main Menu", callback_data="user_start"),
-            InlineKeyboardButton("❓ Help", callback_data="user_help")
-        ]])
+        keyboard = _MENU_HELP_KEYBOARD
         await update.message.reply_text(
             "❌ *Invalid Command*\n\n"
             "Usage: `/add <pincode>`\n"
             "Example: `/add 600113`",
-            parse_mode="Markdown",
             reply_markup=keyboard
         )
     except Exception as e:
         app_logger.error(f"Error in /add command for user {user.id}: {e}", exc_info=True)
-        keyboard = InlineKeyboardMarkup([[
-            InlineKeyboardButton("🏠 Main Menu", callback_data="user_start"),
-            InlineKeyboardButton("📞 Contact Admin", callback_data="user_contact_admin")
-        ]])
+        keyboard = _MENU_CONTACT_KEYBOARD
         await update.message.reply_text(
             "❌ *Something went wrong*\n\n"
             "Please try again or contact support.",
-            parse_mode="Markdown",
             reply_markup=keyboard
         )
 
@@ -285,34 +411,11 @@ async def proof_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     """Handle /proof command - Show payment instructions."""
     chat_id = update.effective_chat.id
     
-    proof_text = (
-        "💳 *Payment Instructions*\n\n"
-        
-        "Step 1️⃣: Make Payment\n"
-        "Transfer ₹99/month to:\n"
-        "UPI: admin@bank (or your UPI ID)\n"
-        "Or use the payment link: [Pay Here](https://payment.link)\n\n"
-        
-        "Step 2️⃣: Take Screenshot\n"
-        "Capture the payment confirmation\n\n"
-        
-        "Step 3️⃣: Upload Screenshot\n"
-        "Send the screenshot here using the camera icon\n\n"
-        
-        "Step 4️⃣: Wait for Approval\n"
-        "We'll verify and activate within 1-2 hours\n\n"
-        
-        "Your User ID: `{}`\n"
-        "Include this in your payment notes!\n\n"
-        
-        "❓ Need help? Use `/dm <message>`"
-    ).format(chat_id)
+    proof_text = _PROOF_TEXT.format(chat_id)
     
-    keyboard = InlineKeyboardMarkup([[
-        InlineKeyboardButton("📸 Upload Payment Screenshot", callback_data="user_upload_proof")
-    ]])
+    keyboard = _UPLOAD_PROOF_KEYBOARD
     
-    await update.message.reply_text(proof_text, parse_mode="Markdown", reply_markup=keyboard)
+    await update.message.reply_text(proof_text, reply_markup=keyboard)
 
 
 # --- Handle Photo Proof ---
@@ -337,20 +440,28 @@ async def handle_proof_photo(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     caption = f"New payment proof from @{user.username} (ID: {user.id})"
     
+    ack = None
     try:
-        # Forward photo to admin group
+        # Forward photo to admin group while acknowledging; if the forward
+        # fails, the acknowledgement is turned into the error
         photo_file = update.message.photo[-1]
-        await context.bot.send_photo(
-            chat_id=Config.ADMIN_GROUP_ID, 
-            photo=photo_file.file_id, 
-            caption=caption, 
-            reply_markup=keyboard
+        forwarded, ack = await asyncio.gather(
+            context.bot.send_photo(
+                chat_id=Config.ADMIN_GROUP_ID, 
+                photo=photo_file.file_id, 
+                caption=caption, 
+                parse_mode=None,
+                reply_markup=keyboard
+            ),
+            update.message.reply_text("✅ Your proof has been submitted for review."),
+            return_exceptions=True
         )
-        await update.message.reply_text("✅ Your proof has been submitted for review.")
+        if isinstance(forwarded, Exception):
+            raise forwarded
         user_activity_logger.info(f"Proof from {user.id} forwarded to admin group.")
     except Exception as e:
         app_logger.error(f"Failed to process proof from {user.id}: {e}")
-        await update.message.reply_text("Sorry, there was an error submitting your proof.")
+        await _replace_ack(update, ack, "Sorry, there was an error submitting your proof.")
 
 
 # --- Subscription Command ---
@@ -372,20 +483,13 @@ async def subscription_command(
         days_left = (end_date - date.today()).days if end_date else 0
         
         # Status indicator
-        status_icons = {
-            "active": "✅",
-            "pending": "⏳",
-            "expired": "❌",
-            "none": "ℹ️",
-            "blocked": "🚫"
-        }
-        status_emoji = status_icons.get(status, "❓")
+        status_emoji = _STATUS_ICONS.get(status, "❓")
         
         # Progress bar (10 blocks)
         progress_bar = ""
         if status == "active" and days_left > 0:
-            filled = min(int(days_left / 3), 10)  # Max 10 blocks, 3 days per block
-            bar = "🟩" * filled + "🟥" * (10 - filled)
+            filled = min(days_left // 3, 10)  # Max 10 blocks, 3 days per block
+            bar = _PROGRESS_BARS[filled]
             progress_bar = f"\n{bar}\n{days_left} days left"
         
         message = (
@@ -407,12 +511,11 @@ async def subscription_command(
         elif status == "none":
             message += "ℹ️ No active subscription yet. Use `/add <pincode>` to get started!"
         
-        await message_source.reply_text(message, parse_mode="Markdown")
+        await message_source.reply_text(message)
     else:
         await message_source.reply_text(
             "❌ No data found.\n\n"
-            "Use `/start` to begin the setup process.",
-            parse_mode="Markdown"
+            "Use `/start` to begin the setup process."
         )
 
 
@@ -425,28 +528,7 @@ async def rules_command(
     """Handle /rules command - Show service rules."""
     message_source = update.message if not from_button else update.callback_query.message
     
-    rules_text = (
-        "📜 *Service Rules & Guidelines*\n\n"
-        
-        "🎯 *General*\n"
-        "1. Each subscription is valid for one pincode only\n"
-        "2. You can change your pincode anytime with `/add <new_pincode>`\n"
-        "3. This service is for informational purposes only\n\n"
-        
-        "✅ *Do's*\n"
-        "• Set a valid pincode for accurate alerts\n"
-        "• Contact admin if you have issues\n"
-        "• Keep your account active by renewing on time\n\n"
-        
-        "❌ *Don'ts*\n"
-        "• Spam commands (may result in temporary block)\n"
-        "• Share bot access with others\n"
-        "• Use automated scripts or bots\n\n"
-        
-        "⚠️ *Violations*\n"
-        "Repeated violations may result in account suspension."
-    )
-    await message_source.reply_text(rules_text, parse_mode="Markdown")
+    await message_source.reply_text(_RULES_TEXT)
 
 
 # --- DM Command ---
@@ -454,57 +536,50 @@ async def rules_command(
 async def dm_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /dm command - Send message to admin."""
     user = update.effective_user
-    message_text = " ".join(context.args)
+    
+    if await is_user_blocked(user.id):
+        await update.message.reply_text(BLOCKED_TEXT)
+        return
+    
+    # Everything after the command, with its spacing and line breaks intact
+    parts = update.message.text.split(None, 1)
+    message_text = parts[1] if len(parts) > 1 else ""
     
     if not message_text:
         await update.message.reply_text(
-            "Usage: `/dm <your message to the admin>`",
-            parse_mode="Markdown"
+            "Usage: `/dm <your message to the admin>`"
         )
         return
     
-    admin_message = (
-        f"New message from @{user.username} (ID: `{user.id}`):\n\n"
-        f"_{message_text}_\n\n"
-        f"To reply, tap to copy and send:\n"
-        f"`/reply {user.id} <your message>`"
+    # User text is escaped so a stray _ or * can't make the forward fail; legacy
+    # Markdown can't escape inside an entity, so the body is no longer italic
+    admin_message = _DM_TEMPLATE.format(
+        username=escape_markdown(str(user.username)),
+        chat_id=user.id,
+        message=escape_markdown(message_text)
     )
     
-    await context.bot.send_message(
-        chat_id=Config.ADMIN_GROUP_ID, 
-        text=admin_message, 
-        parse_mode="Markdown"
+    # Forward to the admin group while acknowledging; if the forward fails,
+    # the acknowledgement is turned into the error
+    delivered, ack = await asyncio.gather(
+        context.bot.send_message(
+            chat_id=Config.ADMIN_GROUP_ID, 
+            text=admin_message
+        ),
+        update.message.reply_text("✅ Your message has been sent to the admin."),
+        return_exceptions=True
     )
-    await update.message.reply_text("✅ Your message has been sent to the admin.")
+    if isinstance(delivered, Exception):
+        app_logger.error(f"Failed to forward DM from {user.id}: {delivered}")
+        await _replace_ack(update, ack, "Sorry, there was an error sending your message.")
+        return
     user_activity_logger.info(f"DM from {user.id} forwarded to admin group.")
 
 
 # --- Help Command ---
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /help command - Show available commands for users."""
-    help_text = (
-        "🆘 *Available Commands*\n\n"
-        
-        "🚀 *Getting Started*\n"
-        "`/start` - Main menu with quick actions\n"
-        "`/add <pincode>` - Set your delivery location\n"
-        "_Example: `/add 600113`_\n\n"
-        
-        "📊 *Account Management*\n"
-        "`/subscription` - Check your subscription status\n"
-        "`/proof` - Get payment instructions\n"
-        "`/rules` - View service rules\n\n"
-        
-        "💬 *Communication*\n"
-        "`/dm <message>` - Send a message to admin\n"
-        "`/help` - Show this help menu\n\n"
-        
-        "💡 *Pro Tips*\n"
-        "• You can use inline buttons - no need to type commands!\n"
-        "• Your pincode can be changed anytime\n"
-        "• Premium members get priority support\n"
-    )
-    await update.message.reply_text(help_text, parse_mode="Markdown")
+    await update.message.reply_text(_HELP_TEXT)
 
 # --- Pause Command ---
 @rate_limit(30)  # Allow every 30 seconds (was 60)
@@ -514,39 +589,32 @@ async def pause_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     chat_id = user.id
     
     try:
+        # Pause flag, pause date and status come back in one query
+        is_paused, pause_until, status = await get_user_pause_state(chat_id)
+        
         # Check if user is already paused
-        is_paused = await is_user_paused(chat_id)
         if is_paused:
-            pause_until = await get_pause_until_date(chat_id)
             pause_text = f"{pause_until.strftime('%d %b %Y')}" if pause_until else "unknown date"
             
             await update.message.reply_text(
                 "⏸️ *Already Paused*\n\n"
                 f"Your subscription is paused until {pause_text}.\n"
-                "Use `/resume` to reactivate it earlier.",
-                parse_mode="Markdown"
+                "Use `/resume` to reactivate it earlier."
             )
             return
         
         # Check subscription status
-        status = await get_user_subscription_status(chat_id)
         if status != 'active':
             await update.message.reply_text(
                 "❌ Cannot Pause\n\n"
                 "Only active subscriptions can be paused.\n"
                 f"Your current status: {(status or 'none').upper()}\n\n"
-                "💡 *Tip*: Set up a subscription first using `/add <pincode>`",
-                parse_mode="Markdown"
+                "💡 *Tip*: Set up a subscription first using `/add <pincode>`"
             )
             return
         
         # Show pause options
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⏸️ Pause for 7 days", callback_data="pause_7")],
-            [InlineKeyboardButton("⏸️ Pause for 14 days", callback_data="pause_14")],
-            [InlineKeyboardButton("⏸️ Pause for 30 days", callback_data="pause_30")],
-            [InlineKeyboardButton("❌ Cancel", callback_data="pause_cancel")]
-        ])
+        keyboard = _PAUSE_KEYBOARD
         
         message = (
             "⏸️ *Pause Subscription*\n\n"
@@ -556,13 +624,12 @@ async def pause_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             "Choose an option:"
         )
         
-        await update.message.reply_text(message, reply_markup=keyboard, parse_mode="Markdown")
+        await update.message.reply_text(message, reply_markup=keyboard)
     except Exception as e:
         app_logger.error(f"Error in /pause command for user {chat_id}: {e}", exc_info=True)
         await update.message.reply_text(
             "❌ *Something went wrong*\n\n"
-            "Please try again later or contact support.",
-            parse_mode="Markdown"
+            "Please try again later or contact support."
         )
 
 
@@ -574,25 +641,21 @@ async def resume_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     chat_id = user.id
     
     try:
-        # Check if user is paused
-        is_paused = await is_user_paused(chat_id)
+        # Check if user is paused, reading the actual subscription status with it
+        is_paused, _, status = await get_user_pause_state(chat_id)
         if not is_paused:
-            # Check actual subscription status
-            status = await get_user_subscription_status(chat_id)
             if status == 'active':
                 await update.message.reply_text(
                     "ℹ️ *Not Paused*\n\n"
                     "Your subscription is not currently paused.\n"
-                    "It's active and running! 🎉",
-                    parse_mode="Markdown"
+                    "It's active and running! 🎉"
                 )
             else:
                 await update.message.reply_text(
                     "❌ *No Active Subscription*\n\n"
                     f"Current status: {(status or 'none').upper()}\n\n"
                     "You need an active subscription to resume.\n"
-                    "Use `/add <pincode>` to set one up.",
-                    parse_mode="Markdown"
+                    "Use `/add <pincode>` to set one up."
                 )
             return
         
@@ -603,15 +666,13 @@ async def resume_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text(
             "✅ *Subscription Resumed!*\n\n"
             "🎉 Your subscription is active again!\n"
-            "You'll start receiving alerts immediately.",
-            parse_mode="Markdown"
+            "You'll start receiving alerts immediately."
         )
     except Exception as e:
         app_logger.error(f"Error in /resume command for user {chat_id}: {e}", exc_info=True)
         await update.message.reply_text(
             "❌ *Something went wrong*\n\n"
-            "Please try again later or contact support.",
-            parse_mode="Markdown"
+            "Please try again later or contact support."
         )
 
 
@@ -636,6 +697,7 @@ async def preferences_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     # Build preference buttons (2 columns)
+    selected_products = set(current_prefs)
     buttons = []
     for i in range(0, len(all_products), 2):
         row = []
@@ -644,7 +706,7 @@ async def preferences_command(update: Update, context: ContextTypes.DEFAULT_TYPE
                 product = all_products[i + j]
                 # Format product name for display
                 product_name = format_product_name(product, max_length=16)
-                is_selected = product in current_prefs
+                is_selected = product in selected_products
                 emoji = "✅" if is_selected else "⭕"
                 row.append(InlineKeyboardButton(
                     f"{emoji} {product_name}",
@@ -658,12 +720,10 @@ async def preferences_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     keyboard = InlineKeyboardMarkup(buttons)
     
     # Build summary of selected products
-    summary_text = ""
     if current_prefs:
-        summary_text = f"\n\n*Currently Tracking ({len(current_prefs)}):*\n"
-        for product in current_prefs:
-            product_name = format_product_name(product, max_length=25)
-            summary_text += f"✅ {product_name}\n"
+        summary_text = f"\n\n*Currently Tracking ({len(current_prefs)}):*\n" + "".join(
+            f"✅ {format_product_name(product, max_length=25)}\n" for product in current_prefs
+        )
     else:
         summary_text = "\n\n_No products selected yet_"
     
@@ -675,7 +735,7 @@ async def preferences_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         + summary_text
     )
     
-    await update.message.reply_text(message, reply_markup=keyboard, parse_mode="Markdown")
+    await update.message.reply_text(message, reply_markup=keyboard)
 
 
 # --- Alert Settings Command ---
@@ -685,27 +745,16 @@ async def alert_settings_command(update: Update, context: ContextTypes.DEFAULT_T
     user = update.effective_user
     chat_id = user.id
     
-    # Parallel queries for faster response
-    frequency, (quiet_start, quiet_end) = await asyncio.gather(
-        get_alert_frequency(chat_id),
-        get_quiet_hours(chat_id)
-    )
+    # Frequency and quiet hours in one query (or straight from cache)
+    frequency, quiet_start, quiet_end = await get_user_alert_config(chat_id)
     
     # Build settings menu
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("⚡ Real-time Alerts", callback_data="freq_instant")],
-        [InlineKeyboardButton("⏰ Hourly Digest", callback_data="freq_hourly")],
-        [InlineKeyboardButton("📅 Daily Digest", callback_data="freq_daily")],
-        [InlineKeyboardButton("🌙 Set Quiet Hours", callback_data="quiet_hours")],
-        [InlineKeyboardButton("🏠 Main Menu", callback_data="user_start")]
-    ])
+    keyboard = _ALERT_SETTINGS_KEYBOARD
     
     quiet_hours_display = "None set"
     if quiet_start and quiet_end:
-        # Convert time objects to strings (HH:MM format)
-        start_str = str(quiet_start)[:5] if isinstance(quiet_start, str) else quiet_start.strftime('%H:%M')
-        end_str = str(quiet_end)[:5] if isinstance(quiet_end, str) else quiet_end.strftime('%H:%M')
-        quiet_hours_display = f"{start_str} - {end_str}"
+        # get_quiet_hours returns "HH:MM:SS" strings; show HH:MM
+        quiet_hours_display = f"{quiet_start[:5]} - {quiet_end[:5]}"
     
     message = (
         "🔔 *Alert Settings*\n\n"
@@ -714,7 +763,7 @@ async def alert_settings_command(update: Update, context: ContextTypes.DEFAULT_T
         "Choose your preference:"
     )
     
-    await update.message.reply_text(message, reply_markup=keyboard, parse_mode="Markdown")
+    await update.message.reply_text(message, reply_markup=keyboard)
 
 
 # --- Quiet Hours Command ---
@@ -728,10 +777,8 @@ async def quiet_hours_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         current_start, current_end = await get_quiet_hours(chat_id)
         current_display = "None set"
         if current_start and current_end:
-            # Convert time objects to strings (HH:MM format)
-            start_str = str(current_start)[:5] if isinstance(current_start, str) else current_start.strftime('%H:%M')
-            end_str = str(current_end)[:5] if isinstance(current_end, str) else current_end.strftime('%H:%M')
-            current_display = f"{start_str} - {end_str}"
+            # get_quiet_hours returns "HH:MM:SS" strings; show HH:MM
+            current_display = f"{current_start[:5]} - {current_end[:5]}"
         
         await update.message.reply_text(
             "🌙 *Set Quiet Hours*\n\n"
@@ -741,8 +788,7 @@ async def quiet_hours_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             "• `/quiethours 22 8` - 10 PM to 8 AM (no alerts)\n"
             "• `/quiethours 23 7` - 11 PM to 7 AM\n"
             "• `/quiethours 0 0` - Clear quiet hours\n\n"
-            "_Hours must be 0-23 (24-hour format)_",
-            parse_mode="Markdown"
+            "_Hours must be 0-23 (24-hour format)_"
         )
         return
     
@@ -753,8 +799,7 @@ async def quiet_hours_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         if not (0 <= start_hour <= 23) or not (0 <= end_hour <= 23):
             await update.message.reply_text(
                 "❌ Invalid hours! Must be 0-23.\n"
-                "Example: `/quiethours 22 8`",
-                parse_mode="Markdown"
+                "Example: `/quiethours 22 8`"
             )
             return
         
@@ -765,8 +810,7 @@ async def quiet_hours_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             
             await update.message.reply_text(
                 "🌙 *Quiet Hours Cleared*\n\n"
-                "You will receive alerts at any time.",
-                parse_mode="Markdown"
+                "You will receive alerts at any time."
             )
             return
         
@@ -779,15 +823,13 @@ async def quiet_hours_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text(
             f"🌙 *Quiet Hours Updated*\n\n"
             f"No alerts from {start_hour:02d}:00 to {end_hour:02d}:00\n\n"
-            f"Alerts during quiet hours will be sent when quiet hours end.",
-            parse_mode="Markdown"
+            f"Alerts during quiet hours will be sent when quiet hours end."
         )
     except (ValueError, IndexError):
         await update.message.reply_text(
             "❌ Invalid format!\n\n"
             "Usage: `/quiethours <start> <end>`\n"
-            "Example: `/quiethours 22 8`",
-            parse_mode="Markdown"
+            "Example: `/quiethours 22 8`"
         )
 
 
@@ -808,36 +850,32 @@ async def getalert_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
                 "❌ *No Pincode Set*\n\n"
                 "Please set your pincode first using:\n"
                 "`/add <pincode>`\n\n"
-                "Example: `/add 411001`",
-                parse_mode="Markdown"
+                "Example: `/add 411001`"
             )
             return
         
-        await update.message.reply_text("🔍 *Checking latest alerts...*", parse_mode="Markdown")
+        await update.message.reply_text("🔍 *Checking latest alerts...*")
         
-        # Fetch pending alerts for this user (these are cached/recent)
-        pending_alerts = await get_pending_alerts(chat_id)
+        # Fetch pending alerts for this user (these are cached/recent) alongside the
+        # pincode's in-stock products, which serve both to filter and as the fallback
+        pending_alerts, available_products = await asyncio.gather(
+            get_pending_alerts(chat_id),
+            get_products_for_pincode(pincode)
+        )
         
         # Verify pending alerts are actually for this pincode
         # This filters out stale alerts from previous pincode changes
-        if pending_alerts:
-            available_for_pincode = await get_products_for_pincode(pincode)
-            if available_for_pincode:
-                # Keep only alerts that have products in current pincode
-                pending_alerts = [a for a in pending_alerts if a[1] in available_for_pincode]
+        if pending_alerts and available_products:
+            # Keep only alerts that have products in current pincode
+            pending_alerts = [a for a in pending_alerts if a[1] in available_products]
         
         # Use pending alerts if available, otherwise fallback to current products
         display_products = pending_alerts if pending_alerts else []
         
-        if not display_products:
-            # No alerts - try to show current available products
-            try:
-                available_products = await get_products_for_pincode(pincode)
-                if available_products:
-                    # Format as alerts with product names embedded as links
-                    display_products = [(None, product, None) for product in available_products]
-            except Exception as e:
-                app_logger.debug(f"Could not fetch available products: {e}")
+        if not display_products and available_products:
+            # No alerts - show current available products
+            # Format as alerts with product names embedded as links
+            display_products = [(None, product, None) for product in available_products]
         
         if not display_products:
             # If no products found, show default message
@@ -846,14 +884,12 @@ async def getalert_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
                 "🔍 System is searching for product availability...\n\n"
                 "_Alerts will appear here as soon as we find stock at your location_\n\n"
                 f"📍 Location: `{pincode}`\n"
-                f"🔄 Checking: Every 5 minutes",
-                parse_mode="Markdown"
+                f"🔄 Checking: Every 5 minutes"
             )
             return
         
         # Always show in consistent alert format with product names as links
-        message = f"🎉 *Product Alerts for {pincode}*\n\n"
-        message += "*Available Products:*\n"
+        message_parts = [f"🎉 *Product Alerts for {pincode}*\n\n", "*Available Products:*\n"]
         
         for idx, alert in enumerate(display_products, 1):
             product_url = alert[1] if len(alert) > 1 else ""
@@ -865,21 +901,20 @@ async def getalert_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             
             # Format as clickable link
             if product_url and product_url.startswith('http'):
-                message += f"{idx}. [✅ {product_name}]({product_url})\n"
+                message_parts.append(f"{idx}. [✅ {product_name}]({product_url})\n")
             else:
-                message += f"{idx}. ✅ {product_name}\n"
+                message_parts.append(f"{idx}. ✅ {product_name}\n")
         
-        message += f"\n_Last updated: Just now_\n"
-        message += f"📍 Location: `{pincode}`\n"
-        message += f"💡 _Tap product name to view on Amul Shop_"
+        message_parts.append("\n_Last updated: Just now_\n")
+        message_parts.append(f"📍 Location: `{pincode}`\n")
+        message_parts.append("💡 _Tap product name to view on Amul Shop_")
         
-        await update.message.reply_text(message, parse_mode="Markdown")
+        await update.message.reply_text("".join(message_parts))
         user_activity_logger.info(f"User {chat_id} checked latest alerts for {pincode}")
         
     except Exception as e:
         app_logger.error(f"Error in /getalert command for user {chat_id}: {e}", exc_info=True)
         await update.message.reply_text(
             "❌ *Something went wrong*\n\n"
-            "Please try again later.",
-            parse_mode="Markdown"
+            "Please try again later."
         )
\ No newline at end of file
@@ -5,6 +5,7 @@ A Telegram bot that monitors Amul product stock and sends alerts to subscribers.
 """
 
 import html
+import importlib.util
 import json
 import asyncio
 import traceback
@@ -13,6 +14,7 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import (
     Application, 
+    Defaults,
     CommandHandler, 
     MessageHandler, 
     CallbackQueryHandler,
@@ -21,7 +23,7 @@ from telegram.ext import (
 )
 
 from config import Config
-from database import init_db, close_connection_pool
+from database import init_db
 from async_db import (
     activate_user_subscription,
     block_user,
@@ -30,15 +32,21 @@ from async_db import (
     toggle_user_preference,
     set_alert_frequency,
     unblock_user,
-    upsert_user,
-    get_user_subscription_status,
-    get_user_subscription_details,
+    register_user,
+    is_user_blocked,
     pause_user_subscription,
+    close_connection_pool,
 )
 from utils import setup_logging, app_logger, user_activity_logger, is_admin
 from scraper import scheduler
 
 # Import all handlers
+from handlers.user import (
+    ACTIVE_MENU_KEYBOARD,
+    PENDING_MENU_KEYBOARD,
+    NEW_USER_MENU_KEYBOARD,
+    BLOCKED_TEXT,
+)
 from handlers import (
     # User handlers
     start_command,
@@ -76,17 +84,17 @@ async def handle_user_menu_button(query, update, context: ContextTypes.DEFAULT_T
     action = query.data.split("_", 1)[1]
     
     if action == "set_pincode":
-        await query.message.reply_text("To set your pincode, please send:\n`/add <pincode>`", parse_mode="Markdown")
+        await query.message.reply_text("To set your pincode, please send:\n`/add <pincode>`")
     elif action == "my_subscription":
         await subscription_command(update, context, from_button=True)
     elif action == "rules":
         await rules_command(update, context, from_button=True)
     elif action == "contact_admin":
-        await query.message.reply_text("To contact an admin, please send:\n`/dm <your message>`", parse_mode="Markdown")
+        await query.message.reply_text("To contact an admin, please send:\n`/dm <your message>`")
     elif action == "help":
         await help_command(update, context)
     elif action == "payment_proof":
-        await query.message.reply_text("To submit your payment proof, please send:\n`/proof`", parse_mode="Markdown")
+        await query.message.reply_text("To submit your payment proof, please send:\n`/proof`")
     elif action == "proof_info":
         await proof_command(update, context)
     elif action == "start":
@@ -99,21 +107,16 @@ async def handle_start_button(query, context: ContextTypes.DEFAULT_TYPE) -> None
     user = query.from_user
     chat_id = user.id
     
-    # Register/update user in database
-    await upsert_user(chat_id, user.username)
+    if await is_user_blocked(chat_id):
+        await query.edit_message_text(BLOCKED_TEXT)
+        return
     
-    # Check user's current status
-    status = await get_user_subscription_status(chat_id) or 'none'
-    user_data = await get_user_subscription_details(chat_id)
-    pincode = user_data[0] if user_data else None
+    # Register/update the user and read back their current status in one go
+    pincode, status, _ = await register_user(chat_id, user.username)
     
     # Build interactive menu based on status
     if status == 'active':
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📊 My Subscription", callback_data="user_my_subscription")],
-            [InlineKeyboardButton("📝 Change Pincode", callback_data="user_set_pincode")],
-            [InlineKeyboardButton("❓ Help", callback_data="user_help")]
-        ])
+        keyboard = ACTIVE_MENU_KEYBOARD
         welcome_message = (
             f"👋 Welcome back, {user.first_name}!\n\n"
             f"✅ Your subscription is active 🎉\n"
@@ -121,21 +124,14 @@ async def handle_start_button(query, context: ContextTypes.DEFAULT_TYPE) -> None
             f"You're receiving alerts for your area!"
         )
     elif status == 'pending':
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⏳ Check Status", callback_data="user_my_subscription")],
-            [InlineKeyboardButton("📞 Contact Admin", callback_data="user_contact_admin")]
-        ])
+        keyboard = PENDING_MENU_KEYBOARD
         welcome_message = (
             f"👋 Welcome back, {user.first_name}!\n\n"
             f"⏳ Your proof is pending review.\n"
             f"We'll notify you once approved!"
         )
     else:
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🚀 Set Pincode & Start", callback_data="user_set_pincode")],
-            [InlineKeyboardButton("📜 Rules", callback_data="user_rules")],
-            [InlineKeyboardButton("❓ How It Works", callback_data="user_help")]
-        ])
+        keyboard = NEW_USER_MENU_KEYBOARD
         welcome_message = (
             f"👋 Welcome, {user.first_name}! 🎉\n\n"
             f"I'm your personal Amul Product Alert Bot 🥛\n\n"
@@ -143,7 +139,8 @@ async def handle_start_button(query, context: ContextTypes.DEFAULT_TYPE) -> None
             f"Let's get started 👇"
         )
     
-    await query.edit_message_text(welcome_message, reply_markup=keyboard)
+    # Names are sent verbatim, so this message opts out of the Markdown default
+    await query.edit_message_text(welcome_message, parse_mode=None, reply_markup=keyboard)
 
 
 async def handle_pause_button(query, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -169,8 +166,7 @@ async def handle_pause_button(query, context: ContextTypes.DEFAULT_TYPE) -> None
             f"⏸️ *Subscription Paused!*\n\n"
             f"Your subscription is paused for {days} days.\n"
             f"📅 Will resume automatically on: {resume_date.strftime('%d %b %Y')}\n\n"
-            f"You won't receive alerts during this time.",
-            parse_mode="Markdown"
+            f"You won't receive alerts during this time."
         )
     except ValueError:
         await query.answer("❌ Invalid pause duration", show_alert=True)
@@ -226,8 +222,7 @@ async def handle_frequency_button(query, context: ContextTypes.DEFAULT_TYPE) ->
     emoji = emoji_map.get(frequency, "🔔")
     
     await query.edit_message_text(
-        f"{emoji} *Alert frequency updated to {frequency.upper()}!*\n\nYour preference has been saved.",
-        parse_mode="Markdown"
+        f"{emoji} *Alert frequency updated to {frequency.upper()}!*\n\nYour preference has been saved."
     )
 
 
@@ -244,14 +239,14 @@ async def handle_confirmation_button(query, context: ContextTypes.DEFAULT_TYPE)
     
     if action == "block":
         if await block_user(target_chat_id):
-            await query.edit_message_text(f"✅ User {target_chat_id} has been blocked by {admin_user.first_name}.")
+            await query.edit_message_text(f"✅ User {target_chat_id} has been blocked by {admin_user.first_name}.", parse_mode=None)
             user_activity_logger.info(f"User {target_chat_id} BLOCKED by admin {admin_user.id}.")
         else:
             await query.edit_message_text(f"User {target_chat_id} not found.")
     
     elif action == "unblock":
         if await unblock_user(target_chat_id):
-            await query.edit_message_text(f"✅ User {target_chat_id} has been unblocked by {admin_user.first_name}.")
+            await query.edit_message_text(f"✅ User {target_chat_id} has been unblocked by {admin_user.first_name}.", parse_mode=None)
             user_activity_logger.info(f"User {target_chat_id} UNBLOCKED by admin {admin_user.id}.")
         else:
             await query.edit_message_text(f"User {target_chat_id} not found in blocklist.")
@@ -276,6 +271,7 @@ async def handle_admin_action_button(query, context: ContextTypes.DEFAULT_TYPE)
             )
             await query.edit_message_caption(
                 caption=f"✅ Approved by {admin_user.first_name}.", 
+                parse_mode=None,
                 reply_markup=None
             )
             user_activity_logger.info(f"User {target_chat_id} approved by admin {admin_user.id}.")
@@ -284,6 +280,7 @@ async def handle_admin_action_button(query, context: ContextTypes.DEFAULT_TYPE)
             if await block_user(target_chat_id):
                 await query.edit_message_caption(
                     caption=f"🚫 User {target_chat_id} has been blocked by {admin_user.first_name}.", 
+                    parse_mode=None,
                     reply_markup=None
                 )
                 user_activity_logger.info(f"User {target_chat_id} BLOCKED by admin {admin_user.id}.")
@@ -297,6 +294,7 @@ async def handle_admin_action_button(query, context: ContextTypes.DEFAULT_TYPE)
             )
             await query.edit_message_caption(
                 caption=f"❓ New proof requested from user {target_chat_id} by {admin_user.first_name}.", 
+                parse_mode=None,
                 reply_markup=None
             )
             user_activity_logger.info(f"Admin {admin_user.id} requested new proof from {target_chat_id}.")
@@ -330,8 +328,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 await handle_confirmation_button(query, context)
         elif query.data == "quiet_hours":
             await query.edit_message_text(
-                "🌙 *Quiet Hours*\n\nSet a time range when you don't want alerts.\nExample: 10 PM to 8 AM\n\nSend: `/quiethours 22 8`",
-                parse_mode="Markdown"
+                "🌙 *Quiet Hours*\n\nSet a time range when you don't want alerts.\nExample: 10 PM to 8 AM\n\nSend: `/quiethours 22 8`"
             )
         elif ":" in query.data:  # Admin action buttons
             await handle_admin_action_button(query, context)
@@ -416,7 +413,7 @@ async def shutdown_handler(application: Application) -> None:
     except Exception as e:
         app_logger.error(f"Error during shutdown: {e}")
     finally:
-        close_connection_pool()  # ✅ Add this
+        await close_connection_pool()
         app_logger.info("Database connection pool closed")
 
 def main() -> None:
@@ -436,6 +433,11 @@ def main() -> None:
     application = (
         Application.builder()
         .token(Config.BOT_TOKEN)
+        # Most replies are Markdown; plain-text ones pass parse_mode=None
+        .defaults(Defaults(parse_mode=ParseMode.MARKDOWN))
+        # With the optional h2 package, HTTP/2 multiplexes concurrent sends over
+        # a single TLS connection
+        .http_version("2" if importlib.util.find_spec("h2") else "1.1")
         .post_init(post_init)
         .post_stop(shutdown_handler)
         .build()
@@ -4,9 +4,13 @@ Handles Selenium WebDriver operations and stock checking on category pages.
 """
 
 import time
+import atexit
 import random
 import asyncio
-from typing import Optional, Tuple, Dict, List
+from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Dict, List, Set
 
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
@@ -14,18 +18,32 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException
 
 from config import Config, USER_AGENTS, CATEGORY_URL
-from utils import app_logger, user_activity_logger, send_consolidated_alert
+from utils import app_logger, user_activity_logger, send_consolidated_alert_async
 
 
 # --- Global Scraper Lock ---
 # Prevents concurrent scraper cycles which could cause duplicate alerts
 _scraper_lock = asyncio.Lock()
 
+# Blocking WebDriver calls get their own threads, one per pooled browser,
+# so they never starve the DB executor or the default loop executor.
+# Each driver owns its chromedriver and HTTP connection and is only driven by
+# its session's worker, so urllib3's one-connection pool is never contended.
+_selenium_executor = ThreadPoolExecutor(
+    max_workers=max(1, Config.SCRAPER_POOL_SIZE), thread_name_prefix="selenium"
+)
+atexit.register(_selenium_executor.shutdown, wait=False)
+
+# Alert fan-out runs in the background while workers move on to the next
+# pincode; the cycle waits for every send before it finishes
+_alert_tasks: Set[asyncio.Task] = set()
+
 
 # --- Product Name Cleaning ---
+@lru_cache(maxsize=512)
 def clean_product_name(title: str) -> str:
     """Clean up product names by removing unnecessary prefixes."""
     # Remove "Amul " prefix variations
@@ -41,8 +59,61 @@ def clean_product_name(title: str) -> str:
 
 
 # --- Global State ---
-# Product status is now persisted in database (product_status_cache table)
-# No in-memory state needed - database provides persistence across bot restarts
+# Product status is persisted in database (product_status_cache table), so it
+# survives restarts. `_product_status_seen` is a bounded LRU read-through in
+# front of it, keyed by (product_url, pincode), so unchanged products don't
+# cost a SELECT every cycle.
+PRODUCT_STATUS_CACHE_SIZE = 2048
+_product_status_seen: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+
+
+def _remember_status(key: Tuple[str, str], status: str) -> None:
+    """Record a status in the LRU, evicting the least recently used entry."""
+    _product_status_seen[key] = status
+    _product_status_seen.move_to_end(key)
+    if len(_product_status_seen) > PRODUCT_STATUS_CACHE_SIZE:
+        _product_status_seen.popitem(last=False)
+
+
+async def _get_last_status(product_url: str, pincode: str) -> Optional[str]:
+    """Get last-seen product status, falling back to the database on a miss."""
+    from async_db import get_product_status
+    
+    key = (product_url, pincode)
+    if key in _product_status_seen:
+        _product_status_seen.move_to_end(key)
+        return _product_status_seen[key]
+    
+    status = await get_product_status(product_url, pincode)
+    if status is not None:
+        _remember_status(key, status)
+    return status
+
+
+async def _set_last_statuses(pincode: str, statuses: Dict[str, str]) -> None:
+    """Persist new product statuses for a pincode and update the in-process mirror."""
+    from async_db import set_product_statuses
+    
+    await set_product_statuses(pincode, statuses)
+    for product_url, status in statuses.items():
+        _remember_status((product_url, pincode), status)
+
+
+# Static Chrome flags, built once; only the user agent varies per driver
+_CHROME_ARGUMENTS: Tuple[str, ...] = (
+    '--headless',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--no-sandbox',
+    "window-size=1920,1080",
+    # Stock state lives in the DOM - don't download or decode product images
+    '--blink-settings=imagesEnabled=false',
+)
+_CHROME_EXPERIMENTAL_OPTIONS: Dict[str, object] = {
+    # Suppress USB/Bluetooth errors in logs
+    'excludeSwitches': ['enable-logging'],
+    'prefs': {'profile.managed_default_content_settings.images': 2},
+}
 
 
 def setup_driver() -> Optional[webdriver.Chrome]:
@@ -54,17 +125,16 @@ def setup_driver() -> Optional[webdriver.Chrome]:
         return None
     
     options = Options()
-    options.add_argument('--headless')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--no-sandbox')
-    options.add_argument("window-size=1920,1080")
+    for argument in _CHROME_ARGUMENTS:
+        options.add_argument(argument)
     options.add_argument(f"user-agent={random.choice(USER_AGENTS)}")
-    # Suppress USB/Bluetooth errors in logs
-    options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    for name, value in _CHROME_EXPERIMENTAL_OPTIONS.items():
+        options.add_experimental_option(name, value)
     
     # Path setup
     options.binary_location = Config.CHROME_BINARY_PATH
+    # A Service owns one chromedriver process and is stopped on quit(), so
+    # pooled drivers can't share it - build a fresh one per driver
     service = Service(executable_path=Config.CHROMEDRIVER_PATH)
     
     try:
@@ -95,11 +165,17 @@ def _wait_for_page_load(driver: webdriver.Chrome, timeout=10):
 
 async def is_during_quiet_hours(chat_id: int) -> bool:
     """Check if current time is within user's quiet hours."""
-    from datetime import datetime
     from async_db import get_quiet_hours
-    from time_helpers import get_current_time_only, is_between_times
     
     quiet_start, quiet_end = await get_quiet_hours(chat_id)
+    return _in_quiet_hours(quiet_start, quiet_end)
+
+
+def _in_quiet_hours(quiet_start: Optional[str], quiet_end: Optional[str]) -> bool:
+    """Check if current time falls between 'HH:MM:SS' quiet hour bounds."""
+    from datetime import datetime
+    from time_helpers import get_current_time_only, is_between_times
+    
     if not quiet_start or not quiet_end:
         return False
     
@@ -142,14 +218,13 @@ def _change_pincode(
                 
                 # Scroll to top to ensure no sticky headers block it
                 driver.execute_script("window.scrollTo(0, 0);")
-                time.sleep(0.5)
+                wait.until(lambda d: d.execute_script("return window.pageYOffset;") == 0)
                 
                 # Force Click
                 driver.execute_script("arguments[0].click();", location_wrapper)
                 
                 # Wait for modal to appear
                 wait.until(EC.visibility_of_element_located((By.ID, "locationWidgetModal")))
-                time.sleep(1) # Animation buffer
                 
             except TimeoutException:
                 app_logger.error("STEP 1 FAILED: Could not click Location Button or Modal did not open.")
@@ -176,18 +251,20 @@ def _change_pincode(
             driver.execute_script("arguments[0].dispatchEvent(new Event('input', { bubbles: true }));", input_el)
             driver.execute_script("arguments[0].dispatchEvent(new Event('change', { bubbles: true }));", input_el)
             
-            time.sleep(2) # Wait for AJAX suggestions
-            
         except Exception as e:
             app_logger.error(f"STEP 3 FAILED: JS Injection error: {e}")
             raise
 
         # STEP 4: SELECT SUGGESTION
+        # The clickable-wait below doubles as the wait for AJAX suggestions
         try:
             # Xpath looks for a paragraph containing the pincode inside the item list
             suggestion_xpath = f"//p[contains(@class, 'item-name') and contains(text(), '{new_pincode}')]"
             suggestion = wait.until(EC.element_to_be_clickable((By.XPATH, suggestion_xpath)))
             
+            # Remember the current grid so we can tell when it's been replaced
+            old_cards = driver.find_elements(By.CSS_SELECTOR, "div.product-grid-body")
+            
             # Force click suggestion
             driver.execute_script("arguments[0].click();", suggestion)
             
@@ -201,8 +278,10 @@ def _change_pincode(
         try:
             # Wait for modal to vanish
             wait.until(EC.invisibility_of_element_located((By.ID, "locationWidgetModal")))
-            # Wait for reload spinner or grid refresh
-            time.sleep(2)
+            # The old grid detaches once the page re-renders for the new pincode
+            if old_cards:
+                WebDriverWait(driver, 3).until(EC.staleness_of(old_cards[0]))
+            _wait_for_page_load(driver)
         except TimeoutException:
             pass # It's fine if it doesn't explicitly vanish as long as page reloads
             
@@ -237,6 +316,68 @@ def is_driver_healthy(driver: webdriver.Chrome) -> bool:
         return False
 
 
+# --- Browser Pool ---
+class BrowserSession:
+    """A pooled Chrome session and the pincode its page currently shows."""
+    
+    def __init__(self) -> None:
+        self.driver: Optional[webdriver.Chrome] = None
+        self.pincode: Optional[str] = None
+    
+    def ensure_driver(self) -> Optional[webdriver.Chrome]:
+        """Return this session's WebDriver, creating a new one if missing or unhealthy."""
+        if self.driver is not None and is_driver_healthy(self.driver):
+            return self.driver
+        
+        self.close()
+        self.driver = setup_driver()
+        return self.driver
+    
+    def close(self) -> None:
+        """Quit the WebDriver, if one is running."""
+        if self.driver:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                app_logger.warning(f"⚠️ Error closing WebDriver: {e}")
+        self.driver = None
+        self.pincode = None
+
+
+# Sessions are kept alive across scraper cycles and only recreated once they
+# stop responding, so each cycle skips the browser cold start.
+_browser_pool: List[BrowserSession] = []
+
+
+def get_browser_sessions(count: int) -> List[BrowserSession]:
+    """Grow or shrink the browser pool to `count` sessions and return them."""
+    while len(_browser_pool) < count:
+        _browser_pool.append(BrowserSession())
+    
+    while len(_browser_pool) > count:
+        _browser_pool.pop().close()
+    
+    return list(_browser_pool)
+
+
+def close_browser_pool() -> None:
+    """Quit every pooled WebDriver session."""
+    get_browser_sessions(0)
+
+
+# Returns [title, href, is_sold_out] for every product card on the grid
+_EXTRACT_CARDS_JS = """
+return Array.from(document.querySelectorAll('div.product-grid-body')).map(function (card) {
+    var name = card.querySelector('div.product-grid-name a');
+    return [
+        name ? name.innerText : null,
+        name ? name.href : null,
+        card.querySelector("a[title='Notify Me']") !== null
+    ];
+});
+"""
+
+
 def scrape_category_page(
     driver: webdriver.Chrome, 
     pincode: str,
@@ -258,6 +399,11 @@ def scrape_category_page(
         driver.get(CATEGORY_URL)
         _wait_for_page_load(driver)
         time.sleep(3) # Initial hydration wait
+    elif pincode == current_browser_pincode:
+        # Reused session is already on this pincode - reload for fresh stock data
+        app_logger.info("Reloading category page...")
+        driver.refresh()
+        _wait_for_page_load(driver)
 
     # 2. Check/Change Pincode
     if pincode != current_browser_pincode:
@@ -282,29 +428,22 @@ def scrape_category_page(
     sold_out = []
 
     # 4. Extract Data
-    product_cards = driver.find_elements(By.CSS_SELECTOR, "div.product-grid-body")
-    app_logger.info(f"Found {len(product_cards)} products for pincode {pincode}")
-
-    for card in product_cards:
-        try:
-            # Helper to safely get text/attribute
-            name_el = card.find_element(By.CSS_SELECTOR, "div.product-grid-name a")
-            title = name_el.text.strip()
-            link = name_el.get_attribute("href")
-            
-            # Check Stock
-            # If "Notify Me" exists -> Sold Out
-            notify_btn = card.find_elements(By.CSS_SELECTOR, "a[title='Notify Me']")
-            
-            if notify_btn:
-                sold_out.append((title, link))
-            else:
-                in_stock.append((title, link))
+    # One script call reads every card, instead of several WebDriver round
+    # trips per card. "Notify Me" on a card means it is sold out.
+    try:
+        cards = driver.execute_script(_EXTRACT_CARDS_JS) or []
+    except Exception as e:
+        app_logger.warning(f"Could not read product grid for pincode {pincode}: {e}")
+        return [], [], current_browser_pincode
+    app_logger.info(f"Found {len(cards)} products for pincode {pincode}")
 
-        except StaleElementReferenceException:
-            continue
-        except Exception:
+    for title, link, is_sold_out in cards:
+        if not title or not link:
             continue
+        if is_sold_out:
+            sold_out.append((title.strip(), link))
+        else:
+            in_stock.append((title.strip(), link))
 
     return in_stock, sold_out, current_browser_pincode
 
@@ -317,16 +456,9 @@ async def run_scraper_cycle() -> None:
 
 async def _do_scraper_cycle() -> None:
     """Internal scraper implementation with lock held."""
-    from async_db import (
-        get_pincode_data,
-        get_product_status,
-        set_product_status,
-        store_pending_alerts,
-        has_cached_products_for_pincode,
-    )
-    
-    driver = None
     try:
+        from async_db import get_pincode_data
+        
         pincode_to_chat_ids = await get_pincode_data()
         unique_pincodes = list(pincode_to_chat_ids.keys())
         
@@ -335,91 +467,20 @@ async def _do_scraper_cycle() -> None:
             return
         
         app_logger.info(f"🔍 Found {len(unique_pincodes)} active pincodes with subscribers: {unique_pincodes}")
-
-        driver = setup_driver()
-        if not driver:
-            app_logger.error("❌ Could not initialize WebDriver. Skipping this cycle.")
-            return
         
-        current_browser_pincode: Optional[str] = None
+        # One browser per worker; pincodes are handed out from a shared work-list,
+        # cheapest and most reliable first (new pincodes count as cheapest)
+        pool_size = min(len(unique_pincodes), max(1, Config.SCRAPER_POOL_SIZE))
+        sessions = get_browser_sessions(pool_size)
+        pending = sorted(unique_pincodes, key=lambda p: _pincode_cost.get(p, 0.0))
         
-        for pincode in unique_pincodes:
-            app_logger.info(f"--- Checking {pincode} ---")
-            
-            current_in_stock, current_sold_out, new_pincode = scrape_category_page(
-                driver, pincode, current_browser_pincode
-            )
-            
-            # If new_pincode is None, driver needs restart
-            if new_pincode is None:
-                app_logger.warning(f"Driver state compromised, restarting for next pincode...")
-                if driver:
-                    driver.quit()
-                driver = setup_driver()
-                if not driver:
-                    app_logger.error("❌ Failed to restart WebDriver. Skipping cycle.")
-                    return
-                current_browser_pincode = None
-                continue  # Skip this pincode, try next one with fresh driver
-            
-            current_browser_pincode = new_pincode
-            
-            # Clean product names and prepare lists
-            clean_in_stock = [(clean_product_name(title), url) for title, url in current_in_stock]
-            clean_sold_out = [(clean_product_name(title), url) for title, url in current_sold_out]
-            
-            # Check if this is the FIRST TIME we're scraping this pincode
-            is_first_scrape = not await has_cached_products_for_pincode(pincode)
-            app_logger.info(f"First-time scrape for {pincode}? {is_first_scrape}")
-            
-            # Change Detection Logic (using database for state)
-            has_change = False
-            
-            # Check In Stock
-            in_stock_count = len(clean_in_stock)
-            stock_changes = 0
-            for title, url in clean_in_stock:
-                cached_status = await get_product_status(url, pincode)
-                if cached_status != "stock":
-                    # Alert on status change OR on first scrape
-                    if is_first_scrape or cached_status != None:
-                        has_change = True
-                        stock_changes += 1
-                        change_type = "first-discovery" if is_first_scrape else "status-change"
-                        app_logger.debug(f"  In-stock {change_type}: {title[:30]}... (was: {cached_status}, now: stock)")
-                    await set_product_status(url, pincode, "stock")
-            
-            # Check Sold Out
-            sold_count = len(clean_sold_out)
-            sold_changes = 0
-            for title, url in clean_sold_out:
-                cached_status = await get_product_status(url, pincode)
-                if cached_status != "sold":
-                    # Only alert if status changed (was stock before, now sold)
-                    if cached_status == "stock":
-                        has_change = True
-                        sold_changes += 1
-                        app_logger.debug(f"  Sold-out change detected: {title[:30]}... (was: {cached_status}, now: sold)")
-                    await set_product_status(url, pincode, "sold")
-
-            # Alert
-            if has_change:
-                app_logger.info(f"✅ Changes detected for {pincode}: {stock_changes} in-stock, {sold_changes} sold-out | {in_stock_count} total in stock, {sold_count} sold out")
-                chat_ids = pincode_to_chat_ids.get(pincode, [])
-                app_logger.info(f"   Notifying {len(chat_ids)} users: {chat_ids}")
-                for chat_id in chat_ids:
-                    # Check if user is in quiet hours
-                    if await is_during_quiet_hours(chat_id):
-                        # Store in pending_alerts instead of sending immediately
-                        await store_pending_alerts(chat_id, pincode, clean_in_stock, clean_sold_out)
-                        app_logger.info(f"   └─ User {chat_id} in quiet hours - alert queued")
-                    else:
-                        send_consolidated_alert(chat_id, pincode, clean_in_stock, clean_sold_out)
-                        app_logger.info(f"   └─ User {chat_id} sent immediate alert")
-            else:
-                app_logger.info(f"📊 No changes for {pincode} (checked {in_stock_count} in-stock, {sold_count} sold-out products)")
-            
-            await asyncio.sleep(random.uniform(2, 5))
+        await asyncio.gather(*(
+            _scrape_worker(session, sessions, pending, pincode_to_chat_ids)
+            for session in sessions
+        ))
+        
+        if _alert_tasks:
+            await asyncio.gather(*_alert_tasks, return_exceptions=True)
                 
     except Exception as e:
         app_logger.error(f"❌ Unexpected error in scraper cycle: {type(e).__name__}: {e}")
@@ -431,15 +492,198 @@ async def _do_scraper_cycle() -> None:
             from async_db import clear_old_product_cache
             deleted_count = await clear_old_product_cache(days=14)
             if deleted_count > 0:
+                # Rows are gone from the database; re-read them on next sight
+                _product_status_seen.clear()
                 app_logger.info(f"🧹 Cleaned up {deleted_count} old product cache entries")
         except Exception as e:
             app_logger.warning(f"⚠️ Error cleaning product cache: {e}")
+
+
+# Rolling cost of checking each pincode (EWMA of seconds per check, with
+# failures and empty grids penalised) so flaky pincodes are checked last
+PINCODE_COST_ALPHA = 0.3
+PINCODE_FAILURE_PENALTY_SECONDS = 30.0
+_pincode_cost: Dict[str, float] = {}
+
+
+def _record_pincode_cost(pincode: str, seconds: float, failed: bool) -> None:
+    """Fold one check's duration (plus any failure penalty) into the pincode's EWMA."""
+    if failed:
+        seconds += PINCODE_FAILURE_PENALTY_SECONDS
+    previous = _pincode_cost.get(pincode)
+    _pincode_cost[pincode] = seconds if previous is None else (
+        PINCODE_COST_ALPHA * seconds + (1 - PINCODE_COST_ALPHA) * previous
+    )
+
+
+def _next_pincode(
+    session: BrowserSession,
+    sessions: List[BrowserSession],
+    pending: List[str]
+) -> Optional[str]:
+    """
+    Take the next pincode for a session off the work-list.
+    
+    Prefers the pincode the session's page already shows, then pincodes no
+    other session is holding, so browsers rarely have to change pincode.
+    """
+    if session.pincode in pending:
+        pending.remove(session.pincode)
+        return session.pincode
+    
+    held_elsewhere = {s.pincode for s in sessions if s is not session}
+    for pincode in pending:
+        if pincode not in held_elsewhere:
+            pending.remove(pincode)
+            return pincode
+    
+    return pending.pop(0) if pending else None
+
+
+async def _scrape_worker(
+    session: BrowserSession,
+    sessions: List[BrowserSession],
+    pending: List[str],
+    pincode_to_chat_ids: Dict[str, List[int]]
+) -> None:
+    """Check pincodes from the work-list one at a time on a single browser session."""
+    loop = asyncio.get_running_loop()
+    
+    while True:
+        pincode = _next_pincode(session, sessions, pending)
+        if pincode is None:
+            return
         
-        if driver:
-            try:
-                driver.quit()
-            except Exception as e:
-                app_logger.warning(f"⚠️ Error closing WebDriver: {e}")
+        # Selenium calls block, so keep them off the event loop
+        driver = await loop.run_in_executor(_selenium_executor, session.ensure_driver)
+        if not driver:
+            app_logger.error(f"❌ Could not initialize WebDriver. Skipping pincode {pincode}.")
+            return
+        
+        app_logger.info(f"--- Checking {pincode} ---")
+        
+        started = time.monotonic()
+        current_in_stock, current_sold_out, new_pincode = await loop.run_in_executor(
+            _selenium_executor, scrape_category_page, driver, pincode, session.pincode
+        )
+        _record_pincode_cost(
+            pincode,
+            time.monotonic() - started,
+            failed=new_pincode is None or not (current_in_stock or current_sold_out)
+        )
+        
+        # If new_pincode is None, driver needs restart
+        if new_pincode is None:
+            app_logger.warning(f"Driver state compromised, restarting for next pincode...")
+            await loop.run_in_executor(_selenium_executor, session.close)
+            # Back off with jitter before hitting the site again
+            await asyncio.sleep(random.uniform(1, max(1, Config.RETRY_DELAY_SECONDS)))
+            continue  # Skip this pincode, next one gets a fresh driver
+        
+        session.pincode = new_pincode
+        
+        try:
+            await _process_pincode_results(
+                pincode, current_in_stock, current_sold_out, pincode_to_chat_ids.get(pincode, [])
+            )
+        except Exception as e:
+            app_logger.error(f"❌ Error processing results for {pincode}: {type(e).__name__}: {e}")
+        
+        if Config.PINCODE_DELAY_SECONDS > 0:
+            await asyncio.sleep(Config.PINCODE_DELAY_SECONDS)
+
+
+async def _process_pincode_results(
+    pincode: str,
+    current_in_stock: List[Tuple[str, str]],
+    current_sold_out: List[Tuple[str, str]],
+    chat_ids: List[int]
+) -> None:
+    """Detect stock changes for one pincode and notify its subscribers."""
+    from async_db import store_pending_alerts_bulk, has_cached_products_for_pincode, get_quiet_hours_bulk
+    
+    # Clean product names and prepare lists
+    clean_in_stock = [(clean_product_name(title), url) for title, url in current_in_stock]
+    clean_sold_out = [(clean_product_name(title), url) for title, url in current_sold_out]
+    
+    # Check if this is the FIRST TIME we're scraping this pincode
+    is_first_scrape = not await has_cached_products_for_pincode(pincode)
+    app_logger.info(f"First-time scrape for {pincode}? {is_first_scrape}")
+    
+    # Change Detection Logic (using database for state)
+    has_change = False
+    # New statuses are written together once both lists have been checked
+    status_updates: Dict[str, str] = {}
+    
+    # Check In Stock
+    in_stock_count = len(clean_in_stock)
+    stock_changes = 0
+    for title, url in clean_in_stock:
+        cached_status = await _get_last_status(url, pincode)
+        if cached_status != "stock":
+            # Alert on status change OR on first scrape
+            if is_first_scrape or cached_status != None:
+                has_change = True
+                stock_changes += 1
+                change_type = "first-discovery" if is_first_scrape else "status-change"
+                app_logger.debug(f"  In-stock {change_type}: {title[:30]}... (was: {cached_status}, now: stock)")
+            status_updates[url] = "stock"
+    
+    # Check Sold Out
+    sold_count = len(clean_sold_out)
+    sold_changes = 0
+    for title, url in clean_sold_out:
+        cached_status = await _get_last_status(url, pincode)
+        if cached_status != "sold":
+            # Only alert if status changed (was stock before, now sold)
+            if cached_status == "stock":
+                has_change = True
+                sold_changes += 1
+                app_logger.debug(f"  Sold-out change detected: {title[:30]}... (was: {cached_status}, now: sold)")
+            status_updates[url] = "sold"
+    
+    await _set_last_statuses(pincode, status_updates)
+
+    # Alert
+    if has_change:
+        app_logger.info(f"✅ Changes detected for {pincode}: {stock_changes} in-stock, {sold_changes} sold-out | {in_stock_count} total in stock, {sold_count} sold out")
+        app_logger.info(f"   Notifying {len(chat_ids)} users: {chat_ids}")
+        queued = []
+        immediate = []
+        quiet_hours = await get_quiet_hours_bulk(chat_ids)
+        for chat_id in chat_ids:
+            # Users in quiet hours get the alert stored in pending_alerts instead
+            if _in_quiet_hours(*quiet_hours.get(chat_id, (None, None))):
+                queued.append(chat_id)
+                app_logger.info(f"   └─ User {chat_id} in quiet hours - alert queued")
+            else:
+                immediate.append(chat_id)
+        
+        if queued:
+            await store_pending_alerts_bulk(
+                [(chat_id, pincode, clean_in_stock, clean_sold_out) for chat_id in queued]
+            )
+        
+        if immediate:
+            task = asyncio.create_task(_send_alerts(immediate, pincode, clean_in_stock, clean_sold_out))
+            _alert_tasks.add(task)
+            task.add_done_callback(_alert_tasks.discard)
+            app_logger.info(f"   └─ Sending immediate alerts to {len(immediate)} users")
+    else:
+        app_logger.info(f"📊 No changes for {pincode} (checked {in_stock_count} in-stock, {sold_count} sold-out products)")
+
+
+async def _send_alerts(
+    chat_ids: List[int],
+    pincode: str,
+    in_stock: List[Tuple[str, str]],
+    sold_out: List[Tuple[str, str]]
+) -> None:
+    """Send one pincode's stock alert to all its subscribers concurrently."""
+    await asyncio.gather(*(
+        send_consolidated_alert_async(chat_id, pincode, in_stock, sold_out)
+        for chat_id in chat_ids
+    ))
 
 
 async def check_subscriptions_expiry() -> None:
@@ -531,6 +775,7 @@ async def scheduler() -> None:
             await asyncio.gather(*child_tasks, return_exceptions=True)
         except Exception:
             pass
+        close_browser_pool()
         app_logger.info("🛑 Scheduler stopped")
 
 
@@ -538,10 +783,10 @@ async def send_hourly_digests() -> None:
     """Send hourly digest to users who opted in."""
     from async_db import (
         get_users_by_alert_frequency,
-        get_pending_alerts,
-        mark_alerts_sent,
+        fetch_and_mark_alerts,
+        requeue_alerts,
     )
-    from utils import send_telegram_message
+    from utils import send_telegram_message_async
     
     while True:
         try:
@@ -550,11 +795,11 @@ async def send_hourly_digests() -> None:
             
             for chat_id in hourly_users:
                 try:
-                    alerts = await get_pending_alerts(chat_id)
+                    alerts = await fetch_and_mark_alerts(chat_id)
                     if alerts:
                         # Build message from pending alerts
                         message_parts = ["📊 *Hourly Digest* 📊"]
-                        for product_title, product_url, status in alerts:
+                        for _, product_title, product_url, status in alerts:
                             emoji = "✅" if status == "stock" else "❌"
                             message_parts.append(f"{emoji} [{product_title}]({product_url})")
                         
@@ -564,8 +809,7 @@ async def send_hourly_digests() -> None:
                         sent = False
                         for attempt in range(3):
                             try:
-                                if send_telegram_message(chat_id, message):
-                                    await mark_alerts_sent(chat_id)
+                                if await send_telegram_message_async(chat_id, message):
                                     app_logger.info(f"📧 Hourly digest sent to {chat_id}")
                                     sent = True
                                     break
@@ -578,9 +822,11 @@ async def send_hourly_digests() -> None:
                                     app_logger.warning(f"Retry {attempt+1}/3 for user {chat_id} after {wait_time}s: {retry_error}")
                                     await asyncio.sleep(wait_time)
                                 else:
+                                    await requeue_alerts([alert_id for alert_id, *_ in alerts])
                                     raise
                         
                         if not sent:
+                            await requeue_alerts([alert_id for alert_id, *_ in alerts])
                             app_logger.error(f"Failed to send hourly digest to {chat_id} after 3 attempts")
                 except Exception as e:
                     app_logger.error(f"Error sending hourly digest to {chat_id}: {e}")
@@ -597,10 +843,10 @@ async def send_daily_digests() -> None:
     from datetime import datetime
     from async_db import (
         get_users_by_alert_frequency,
-        get_pending_alerts,
-        mark_alerts_sent,
+        fetch_and_mark_alerts,
+        requeue_alerts,
     )
-    from utils import send_telegram_message
+    from utils import send_telegram_message_async
     from time_helpers import get_current_time
     
     while True:
@@ -613,11 +859,11 @@ async def send_daily_digests() -> None:
                 
                 for chat_id in daily_users:
                     try:
-                        alerts = await get_pending_alerts(chat_id)
+                        alerts = await fetch_and_mark_alerts(chat_id)
                         if alerts:
                             # Build message from pending alerts
                             message_parts = ["📋 *Daily Digest* 📋"]
-                            for product_title, product_url, status in alerts:
+                            for _, product_title, product_url, status in alerts:
                                 emoji = "✅" if status == "stock" else "❌"
                                 message_parts.append(f"{emoji} [{product_title}]({product_url})")
                             
@@ -627,8 +873,7 @@ async def send_daily_digests() -> None:
                             sent = False
                             for attempt in range(3):
                                 try:
-                                    if send_telegram_message(chat_id, message):
-                                        await mark_alerts_sent(chat_id)
+                                    if await send_telegram_message_async(chat_id, message):
                                         app_logger.info(f"📄 Daily digest sent to {chat_id}")
                                         sent = True
                                         break
@@ -641,9 +886,11 @@ async def send_daily_digests() -> None:
                                         app_logger.warning(f"Retry {attempt+1}/3 for user {chat_id} after {wait_time}s: {retry_error}")
                                         await asyncio.sleep(wait_time)
                                     else:
+                                        await requeue_alerts([alert_id for alert_id, *_ in alerts])
                                         raise
                             
                             if not sent:
+                                await requeue_alerts([alert_id for alert_id, *_ in alerts])
                                 app_logger.error(f"Failed to send daily digest to {chat_id} after 3 attempts")
                     except Exception as e:
                         app_logger.error(f"Error sending daily digest to {chat_id}: {e}")
@@ -666,7 +913,7 @@ async def check_expired_pauses() -> None:
         get_pause_until_date,
         resume_user_subscription,
     )
-    from utils import send_telegram_message
+    from utils import send_telegram_message_async
     
     while True:
         try:
@@ -681,7 +928,7 @@ async def check_expired_pauses() -> None:
                         app_logger.info(f"✅ Auto-resumed user {chat_id}")
                         
                         try:
-                            send_telegram_message(
+                            await send_telegram_message_async(
                                 chat_id,
                                 "✅ *Welcome Back!*\n\nYour subscription is active again. You'll start receiving alerts."
                             )
@@ -3,11 +3,16 @@ Utility module for Amul Product Alert Bot.
 Contains logging setup, decorators, and helper functions.
 """
 
+import re
 import time
+import queue
+import atexit
+import asyncio
 import logging
 import requests
-from functools import wraps
-from typing import Callable, Any
+from functools import partial, wraps
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Any, Awaitable
 
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -21,8 +26,15 @@ app_logger = logging.getLogger("amul_bot")
 user_activity_logger = logging.getLogger("user_activity")
 user_activity_logger.propagate = False
 
+# Telegram allows ~30 messages/second per bot. Each send holds a slot for at
+# least a second, so concurrent fan-out stays at or below 25 messages/second.
+_telegram_send_slots = asyncio.Semaphore(25)
+
+# Exactly six ASCII digits; str.isdigit() would also accept other scripts' digits
+_is_pincode = re.compile(r"\d{6}", re.ASCII).fullmatch
+
 # Admin cache (updated every 5 minutes)
-_admin_cache = {"admins": [], "last_update": 0}
+_admin_cache = {"admins": frozenset(), "last_update": 0}
 
 
 # --- Custom Telegram Log Handler ---
@@ -49,6 +61,20 @@ class TelegramLogHandler(logging.Handler):
                 pass  # Silently fail to avoid recursion
 
 
+def _queued(logger: logging.Logger, handler: logging.Handler) -> None:
+    """
+    Attach handler to logger behind a QueueHandler.
+    
+    The actual write (stderr, or an HTTP post for Telegram) happens on a
+    listener thread, so logging never blocks the event loop.
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # Flushes queued records on exit
+    logger.addHandler(QueueHandler(log_queue))
+
+
 def setup_logging() -> None:
     """Configure logging for the application."""
     log_format = '%(asctime)s - %(levelname)s - %(message)s'
@@ -61,7 +87,7 @@ def setup_logging() -> None:
     
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(formatter)
-    app_logger.addHandler(stream_handler)
+    _queued(app_logger, stream_handler)
     
     # User activity logger (sends to Telegram)
     user_activity_logger.setLevel(logging.INFO)
@@ -71,62 +97,28 @@ def setup_logging() -> None:
         
         telegram_handler = TelegramLogHandler(Config.BOT_TOKEN, Config.LOG_GROUP_ID)
         telegram_handler.setFormatter(formatter)
-        user_activity_logger.addHandler(telegram_handler)
+        _queued(user_activity_logger, telegram_handler)
 
 
 # --- Admin Check ---
 async def is_admin(chat_id: int, bot) -> bool:
     """Check if a user is an admin of the admin group with 5-minute cache."""
-    global _admin_cache
-    
     current_time = time.time()
     
     # Return cached result if fresh (< 5 minutes old)
     if current_time - _admin_cache["last_update"] < 300:
-        try:
-            for admin in _admin_cache["admins"]:
-                # admin can be a ChatMember object or a cached simple dict/object
-                if hasattr(admin, "user") and hasattr(admin.user, "id"):
-                    if admin.user.id == chat_id:
-                        return True
-                elif hasattr(admin, "id"):
-                    if admin.id == chat_id:
-                        return True
-                elif isinstance(admin, dict) and admin.get("user"):
-                    # fallback for lightweight cache entries
-                    uid = admin.get("user")
-                    try:
-                        if int(uid) == int(chat_id):
-                            return True
-                    except Exception:
-                        pass
-            return False
-        except Exception:
-            # If cache structure is unexpected, fall back to fresh check
-            pass
+        return chat_id in _admin_cache["admins"]
     
     try:
-        # Update cache
+        # Update cache with just the ids, so every check is a set lookup
         admins = await bot.get_chat_administrators(Config.ADMIN_GROUP_ID)
-        _admin_cache["admins"] = admins
+        _admin_cache["admins"] = frozenset(admin.user.id for admin in admins)
         _admin_cache["last_update"] = current_time
-        
-        for admin in admins:
-            if hasattr(admin, "user") and getattr(admin.user, "id", None) == chat_id:
-                return True
-        return False
     except Exception as e:
         app_logger.error(f"Could not check admin status for {chat_id}: {e}")
-        # Return cached result even if stale
-        try:
-            for admin in _admin_cache["admins"]:
-                if hasattr(admin, "user") and getattr(admin.user, "id", None) == chat_id:
-                    return True
-                elif hasattr(admin, "id") and getattr(admin, "id", None) == chat_id:
-                    return True
-            return False
-        except Exception:
-            return False
+        # Fall through to the cached result even if stale
+    
+    return chat_id in _admin_cache["admins"]
 
 
 # --- Decorators ---
@@ -150,15 +142,17 @@ def admin_only(func: Callable) -> Callable:
 def rate_limit(limit_seconds: int = 5) -> Callable:
     """Decorator to rate-limit command usage per user."""
     def decorator(func: Callable) -> Callable:
+        # A one-token bucket per user: user_data holds the time the token refills
+        key = f"rate_limit:{func.__name__}"
+        
         @wraps(func)
         async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs) -> Any:
-            last_called = context.user_data.get(func.__name__, 0)
-            
-            if time.time() - last_called < limit_seconds:
+            now = time.monotonic()
+            if now < context.user_data.get(key, 0.0):
                 app_logger.info(f"Spam attempt by {update.effective_user.id} for command /{func.__name__}")
                 return
             
-            context.user_data[func.__name__] = time.time()
+            context.user_data[key] = now + limit_seconds
             return await func(update, context, *args, **kwargs)
         return wrapped
     return decorator
@@ -185,6 +179,14 @@ def send_telegram_message(chat_id, text: str, parse_mode: str = "Markdown") -> b
         return False
 
 
+async def send_telegram_message_async(chat_id, text: str, parse_mode: str = "Markdown") -> bool:
+    """Send a message off the event loop, within the global send rate."""
+    loop = asyncio.get_running_loop()
+    return await rate_limited_send(partial(
+        loop.run_in_executor, None, send_telegram_message, chat_id, text, parse_mode
+    ))
+
+
 def send_consolidated_alert(
     chat_id: str, 
     pincode: str, 
@@ -213,6 +215,34 @@ def send_consolidated_alert(
         app_logger.error(f"❌ Error sending alert to {chat_id}: {e}")
 
 
+async def send_consolidated_alert_async(
+    chat_id: str, 
+    pincode: str, 
+    in_stock_products: list, 
+    sold_out_products: list
+) -> None:
+    """Send a consolidated stock alert off the event loop, within the global send rate."""
+    loop = asyncio.get_running_loop()
+    await rate_limited_send(partial(
+        loop.run_in_executor, None, send_consolidated_alert, chat_id, pincode, in_stock_products, sold_out_products
+    ))
+
+
+async def rate_limited_send(send: Callable[[], Awaitable]) -> Any:
+    """
+    Start and await a Telegram send while holding one slot of the bot-wide send rate.
+    
+    `send` is a zero-argument callable returning the awaitable, so nothing
+    (e.g. an executor job) is started before a slot is held.
+    """
+    async with _telegram_send_slots:
+        pacing = asyncio.ensure_future(asyncio.sleep(1))
+        try:
+            return await send()
+        finally:
+            await pacing
+
+
 def validate_pincode(pincode: str) -> tuple[bool, str]:
     """
     Validate pincode format - must be 6 digits (Indian standard).
@@ -221,7 +251,7 @@ def validate_pincode(pincode: str) -> tuple[bool, str]:
         tuple: (is_valid: bool, message: str)
     """
     # Check format - Indian pincodes are always 6 digits
-    if not pincode or not pincode.isdigit() or len(pincode) != 6:
+    if not pincode or not _is_pincode(pincode):
         return False, "❌ Pincode must be exactly 6 digits. Example: 411013"
     
     # All 6-digit pincodes are valid (service area coverage will be checked separately)